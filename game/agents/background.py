@@ -0,0 +1,45 @@
+"""
+
+This module implements an agent whose underlying agent is loaded on a background thread, so that
+a front-end can start answering requests before the deep learning framework and model are ready.
+
+"""
+
+from .base import Agent
+
+import threading
+
+
+class BackgroundAgent(Agent):
+    """
+    Run load_fn on daemon thread and forward moves to agent it returns. First move waits for
+    loading to finish; error raised while loading is raised again there.
+    """
+
+    def __init__(self, load_fn):
+        self._agent = None
+        self._error = None
+
+        self._thread = threading.Thread(target = self._load, args = (load_fn,), daemon = True)
+        self._thread.start()
+
+    @property
+    def is_ready(self):
+        return not self._thread.is_alive()
+
+    def select_move(self, game_state):
+        return self.wait().select_move(game_state)
+
+    def wait(self):
+        self._thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        return self._agent
+
+    def _load(self, load_fn):
+        try:
+            self._agent = load_fn()
+        except Exception as error:
+            self._error = error
@@ -13,22 +13,24 @@ from utils.eye import is_eye
 
 import encoder
 import go_board_fast
-import utils.keras_utils
 
 import numpy as np
 
 
 class DLAgent(Agent):
-    def __init__(self, model, encoder):
-        self._encoder = encoder
-        self._model   = model
+    def __init__(self, model, encoder, xla = False):
+        from inference import CompiledModel
+
+        self._encoder   = encoder
+        self._model     = model
+        self._predictor = CompiledModel(model, xla)
 
     def select_move(self, game_state):
         num_moves    = self._encoder.num_moves()
         state_tensor = self._encoder.encode_board(game_state)
         model_input  = np.array([state_tensor])
 
-        priors, _ = self._model.predict(model_input, verbose = 0)
+        priors, _ = self._predictor(model_input)
 
         priors = priors[0]
 
@@ -61,6 +63,8 @@ class DLAgent(Agent):
             return go_board_fast.Move.pass_turn()
 
     def serialize(self, h5file):
+        import utils.keras_utils
+
         h5file.create_group("encoder")
         h5file.create_group("model")
 
@@ -69,6 +73,8 @@ class DLAgent(Agent):
         utils.keras_utils.save_model_to_hdf5_group(self._model, h5file["model"])
 
 def load_predict_agent(h5file):
+    import utils.keras_utils
+
     board_size   = h5file["encoder"].attrs["board_size"]
     game_encoder = encoder.Encoder(board_size)
     model        = utils.keras_utils.load_model_from_hdf5_group(h5file["model"])
@@ -0,0 +1,158 @@
+"""
+
+This module measures inference speed of network architectures on local CPU. Each network is built
+with random weights, folded for inference as agents play it, and timed at several batch sizes, so
+that architectures can be compared by strength per unit of inference time.
+
+"""
+
+from datetime      import datetime
+from encoder       import Encoder
+from utils.runtime import add_runtime_arguments
+from utils.runtime import configure_runtime_from_args
+
+import numpy as np
+
+import argparse
+import os
+import sys
+import time
+
+
+# Disable TensorFlow warnings.
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+
+def build_predictor(model, engine, xla = False):
+    from inference import CompiledModel
+    from inference import build_inference_model
+    from inference import fold_layers
+
+    if engine == "numpy":
+        return fold_layers(model)
+
+    return CompiledModel(build_inference_model(model), xla)
+
+def measure_latency(predictor, states, duration):
+    """
+    Evaluate states repeatedly for about duration seconds (at least 5 calls) and return latency of
+    each call in seconds.
+    """
+
+    predictor(states)
+
+    latencies = []
+    end_time  = time.perf_counter() + duration
+
+    while len(latencies) < 5 or time.perf_counter() < end_time:
+        start = time.perf_counter()
+
+        predictor(states)
+
+        latencies.append(time.perf_counter() - start)
+
+    return np.array(latencies)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage = "python " + sys.argv[0] + " -n small medium res6x64 -s 1 16 256"
+    )
+
+    parser.add_argument(
+        "-b", "--board", default = 9, type = int, help = "Go ban size (default = 9)"
+    )
+
+    parser.add_argument(
+        "-d", "--duration", default = 1.0, type = float,
+        help = "seconds spent timing each batch size (default = 1)"
+    )
+
+    parser.add_argument(
+        "-e", "--engine", choices = ["keras", "numpy"], default = "keras",
+        help = "inference engine: compiled Keras model or NumPy engine (default = keras)"
+    )
+
+    parser.add_argument(
+        "-n", "--networks", default = ["small", "medium", "res6x64", "res10x128"], nargs = "+",
+        type = str, help = "network architectures (default = small medium res6x64 res10x128)"
+    )
+
+    parser.add_argument(
+        "-s", "--sizes", default = [1, 2, 4, 8, 16, 32, 64, 128, 256], nargs = "+", type = int,
+        help = "batch sizes (default = 1 2 4 ... 256)"
+    )
+
+    parser.add_argument(
+        "--channels-last", action = "store_true", help = "build networks with channels-last layout"
+    )
+
+    parser.add_argument(
+        "--xla", action = "store_true", help = "compile model inference with XLA"
+    )
+
+    add_runtime_arguments(parser)
+
+    return parser.parse_args()
+
+def main():
+    print("\n========== Network Benchmark Module ==========\n")
+
+    args = parse_args()
+
+    # Pin cores and size thread pools before TensorFlow is loaded.
+    configure_runtime_from_args(args)
+
+    from networks.config import build_network
+
+    data_format  = "channels_last" if args.channels_last else "channels_first"
+    game_encoder = Encoder(args.board, data_format)
+    rng          = np.random.default_rng()
+    bench_start  = datetime.now()  # benchmark start time
+    results      = []
+
+    for name in args.networks:
+        try:
+            model = build_network(name, game_encoder)
+        except ValueError as error:
+            print("[-] Skipping {0}: {1}\n".format(name, str(error).splitlines()[0]))
+
+            continue
+
+        predictor = build_predictor(model, args.engine, args.xla)
+
+        print("[+] Network {0}: {1:,} parameters\n".format(name, model.count_params()))
+        print("    {0:>6} {1:>14} {2:>14} {3:>12}".format(
+            "batch", "median (ms)", "p90 (ms)", "evals/s"
+        ))
+
+        evals_per_second = {}
+
+        for batch_size in args.sizes:
+            states    = rng.random((batch_size,) + game_encoder.shape(), dtype = np.float32)
+            latencies = measure_latency(predictor, states, args.duration)
+
+            evals_per_second[batch_size] = batch_size / np.median(latencies)
+
+            print("    {0:>6} {1:>14.3f} {2:>14.3f} {3:>12,.0f}".format(
+                batch_size, 1000 * np.median(latencies), 1000 * np.percentile(latencies, 90),
+                evals_per_second[batch_size]
+            ))
+
+        print()
+
+        results.append((name, evals_per_second))
+
+    if results:
+        print("[+] Evaluations per second at smallest and largest batch size:\n")
+
+        for name, evals_per_second in results:
+            print("    {0:<20} {1:>10,.0f} {2:>12,.0f}".format(
+                name, evals_per_second[min(args.sizes)], evals_per_second[max(args.sizes)]
+            ))
+
+        print()
+
+    print("[+] Benchmark time: {0}".format(datetime.now() - bench_start))
+
+if __name__ == "__main__":
+    main()
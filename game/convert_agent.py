@@ -0,0 +1,190 @@
+"""
+
+This module converts agents between channels-first and channels-last network layouts. Convolution
+and normalization weights do not depend on layout; rows of dense layers that follow flattened
+feature maps are reordered to match flattening order of target layout.
+
+"""
+
+from datetime  import datetime
+from encoder   import Encoder
+from eunkyo    import EunkyoAgent
+from eunkyo    import load_agent
+from inference import layer_inputs
+from inference import producers
+
+import numpy as np
+
+import argparse
+import h5py
+import os
+import sys
+
+
+# Disable TensorFlow warnings.
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+# Axis order taking feature map of source layout to target layout.
+LAYOUT_AXES = {
+    ("channels_first", "channels_last") : (1, 2, 0),
+    ("channels_last", "channels_first") : (2, 0, 1)
+}
+
+def convert_model(model, encoder, data_format):
+    """
+    Build network with same architecture as model in target data format and copy converted
+    weights into it. Architecture is identified among networks package models by weight shapes;
+    residual towers are rebuilt from sizes read from model configuration.
+    """
+
+    from networks.config import FIXED_NETWORKS
+    from networks.config import build_network
+
+    target_encoder = Encoder(encoder.board_size, data_format)
+    residual       = residual_name(model)
+    names          = (residual,) if residual else FIXED_NETWORKS
+
+    for name in names:
+        try:
+            target = build_network(name, target_encoder)
+        except ValueError:
+            continue  # network does not fit board size
+
+        try:
+            convert_weights(model, target, encoder.data_format, data_format)
+        except ValueError:
+            continue
+
+        return target, target_encoder
+
+    raise ValueError("Agent model does not match any network architecture")
+
+def convert_weights(source, target, source_format, target_format):
+    """
+    Copy weights of source into target layer by layer. Raise ValueError if weight shapes differ.
+    """
+
+    flatten_inputs = {
+        layer.name: tuple(layer.input.shape[1:]) for layer in source.layers
+        if type(layer).__name__ == "Flatten"
+    }
+
+    inbound = {layer.name: layer_inputs(layer) for layer in source.layers}
+
+    source_layers = [layer for layer in source.layers if layer.weights]
+    target_layers = [layer for layer in target.layers if layer.weights]
+
+    if len(source_layers) != len(target_layers):
+        raise ValueError("Networks have different number of layers with weights")
+
+    converted = []
+
+    for source_layer, target_layer in zip(source_layers, target_layers):
+        weights = source_layer.get_weights()
+        inputs  = inbound.get(source_layer.name, [])
+
+        if inputs and inputs[0] in flatten_inputs and source_format != target_format:
+            feature_shape = flatten_inputs[inputs[0]]
+            order         = np.arange(np.prod(feature_shape)).reshape(feature_shape)
+            order         = order.transpose(LAYOUT_AXES[(source_format, target_format)]).ravel()
+            weights[0]    = weights[0][order]
+
+        target_shapes = [weight.shape for weight in target_layer.get_weights()]
+
+        if [weight.shape for weight in weights] != target_shapes:
+            raise ValueError("Layer {0} does not match target network".format(source_layer.name))
+
+        converted.append((target_layer, weights))
+
+    for target_layer, weights in converted:
+        target_layer.set_weights(weights)
+
+def residual_name(model):
+    """
+    Residual tower name (see networks/config.py) matching model, or None if model has no residual
+    blocks. Head sizes are found by following first inputs back from outputs to head convolutions.
+    """
+
+    blocks = sum(type(layer).__name__ == "Add" for layer in model.layers)
+
+    if not blocks:
+        return None
+
+    def head(layer):
+        units = []
+
+        while type(layer).__name__ != "Conv2D":
+            if type(layer).__name__ == "Dense":
+                units.append(layer.get_config()["units"])
+
+            layer = model.get_layer(layer_inputs(layer)[0])
+
+        return layer.get_config()["filters"], units
+
+    filters = next(
+        layer.get_config()["filters"] for layer in model.layers
+        if type(layer).__name__ == "Conv2D"
+    )
+
+    (policy_filters, _), (value_filters, value_units) = (
+        head(model.get_layer(name)) for name in producers(model.outputs)
+    )
+
+    return "res{0}x{1}p{2}v{3}h{4}".format(
+        blocks, filters, policy_filters, value_filters, value_units[-1]
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage = "python " + sys.argv[0] + " -a agent -o converted -f channels_last"
+    )
+
+    parser.add_argument(
+        "-a", "--agent", required = True, type = str, help = "agent filename prefix"
+    )
+
+    parser.add_argument(
+        "-f", "--format", choices = ["channels_first", "channels_last"],
+        default = "channels_last", help = "target network layout (default = channels_last)"
+    )
+
+    parser.add_argument(
+        "-o", "--output", required = True, type = str, help = "converted agent filename prefix"
+    )
+
+    return parser.parse_args()
+
+def main():
+    print("\n========== Agent Conversion Module ==========\n")
+
+    args = parse_args()
+
+    agent = load_agent(h5py.File("./outputs/agent/" + args.agent + ".h5", "r"))
+
+    if agent.model is None:
+        raise ValueError("Agent {0} has no trainable model to convert".format(args.agent))
+
+    print("[+] Converting agent to {0} ...\n".format(args.format))
+
+    convert_start = datetime.now()  # conversion start time
+
+    model, encoder = convert_model(agent.model, agent.encoder, args.format)
+
+    # Check that converted network computes same outputs on random board planes.
+    planes     = np.random.default_rng().random((8, encoder.num_planes) + (encoder.board_size,) * 2)
+    difference = max(
+        float(np.max(np.abs(np.asarray(source) - np.asarray(target))))
+        for source, target in zip(
+            agent.model(agent.encoder.model_layout(planes), training = False),
+            model(encoder.model_layout(planes), training = False)
+        )
+    )
+
+    with h5py.File("./outputs/agent/" + args.output + ".h5", "w") as h5:
+        EunkyoAgent(model, encoder).serialize(h5)
+
+    print("[+] Maximum output difference: {0:.2e}".format(difference))
+    print("\n[+] Conversion time: {0}".format(datetime.now() - convert_start))
+
+if __name__ == "__main__":
+    main()
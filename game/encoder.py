@@ -9,6 +9,7 @@ from go_board_fast import Move
 from go_types      import Player
 from go_types      import Point
 
+import hashlib
 import numpy as np
 
 
@@ -17,30 +18,122 @@ import numpy as np
 # 8     : 1 if player gets komi
 # 9     : 1 if opponent gets komi
 # 10    : move illegal due to ko rule
+KO_PLANE   = 10
 NUM_PLANES = 11
 
 class Encoder():
-    def __init__(self, board_size):
-        self.board_size = board_size
-        self.num_planes = NUM_PLANES
-        self.point_move = {}
+    """
+    Board tensors are num_planes x N x N (channels first) or N x N x num_planes (channels last),
+    matching data format of network. Experience always stores channels-first planes, which are
+    converted to network layout with model_layout().
+    """
 
-    def decode_move_index(self, index):
+    def __init__(self, board_size, data_format = "channels_first"):
+        if data_format not in ("channels_first", "channels_last"):
+            raise ValueError("Unsupported data format: {0}".format(data_format))
+
+        self.board_size  = board_size
+        self.data_format = data_format
+        self.num_planes  = NUM_PLANES
+        self.point_move  = {}
+
+        self._init_move_tables()
+
+    def _init_move_tables(self):
         """
-        Board positions are decoded as vector elements.
+        Precompute lookup tables between vector indices, board points and interned move objects so
+        that whole policy vectors can be decoded with array indexing instead of per-index calls.
+        Pass is stored as point (0, 0) in index_points and as point None in point_index.
         """
 
-        if index == self.board_size * self.board_size:
-            point = None
-        else:
+        num_points = self.board_size * self.board_size
+
+        self.index_points = np.zeros((num_points + 1, 2), dtype = np.int32)
+        self.index_moves  = []
+        self.point_index  = {None: num_points}
+
+        for index in range(num_points):
             ro    = index // self.board_size
             co    = index %  self.board_size
             point = Point(row = ro + 1, col = co + 1)
 
-        return self.record_move(point)
+            self.index_points[index] = point
+            self.point_index[point]  = index
+            self.index_moves.append(self.record_move(point))
+
+        self.index_moves.append(self.record_move(None))
+
+        self.move_index = {move: index for index, move in enumerate(self.index_moves)}
+
+    def decode_move_index(self, index):
+        """
+        Board positions are decoded as vector elements.
+        """
+
+        return self.index_moves[index]
+
+    def decode_moves(self, indices):
+        """
+        Decode array of vector elements into list of interned move objects.
+        """
+
+        index_moves = self.index_moves
+
+        return [index_moves[index] for index in np.asarray(indices, dtype = np.int64).tolist()]
 
     def encode_board(self, game_state):
-        board_tensor = np.zeros(self.shape())
+        """
+        Encode board as network input tensor.
+        """
+
+        planes = self.encode_planes(game_state)
+
+        if self.data_format == "channels_last":
+            return np.moveaxis(planes, 0, -1)
+
+        return planes
+
+    def encode_move(self, move):
+        """
+        Moves are represented as vector elements and encoded as board positions.
+        Last index represents pass.
+        Neural network does not learn resignation.
+        """
+
+        if move.is_play:
+            return (self.board_size * (move.point.row - 1) + (move.point.col - 1))
+        elif move.is_pass:
+            return self.board_size * self.board_size
+
+        raise ValueError("Cannot encode resignation!")
+
+    def encode_moves(self, moves):
+        """
+        Encode sequence of moves as integer array of vector elements. Interned moves returned by
+        decode_moves() are resolved with single dictionary lookup.
+        """
+
+        indices = np.empty(len(moves), dtype = np.int64)
+
+        for i, move in enumerate(moves):
+            index = self.move_index.get(move)
+
+            if index is None:
+                if move.is_resign:
+                    raise ValueError("Cannot encode resignation!")
+
+                index = self.point_index[move.point]
+
+            indices[i] = index
+
+        return indices
+
+    def encode_planes(self, game_state):
+        """
+        Encode board as channels-first planes, as stored in experience.
+        """
+
+        board_tensor = np.zeros((self.num_planes, self.board_size, self.board_size))
         next_player  = game_state.next_player
 
         if game_state.next_player == Player.white:
@@ -66,19 +159,25 @@ class Encoder():
 
         return board_tensor
 
-    def encode_move(self, move):
+    def ko_key(self, planes):
         """
-        Moves are represented as vector elements and encoded as board positions.
-        Last index represents pass.
-        Neural network does not learn resignation.
+        Digest of ko plane of channels-first planes as signed 64-bit integer. Ko legality depends on
+        earlier positions of game, so same board with same player to move may differ in this plane.
         """
 
-        if move.is_play:
-            return (self.board_size * (move.point.row - 1) + (move.point.col - 1))
-        elif move.is_pass:
-            return self.board_size * self.board_size
+        digest = hashlib.blake2b(np.packbits(planes[KO_PLANE] > 0).tobytes(), digest_size = 8)
 
-        raise ValueError("Cannot encode resignation!")
+        return int.from_bytes(digest.digest(), "little", signed = True)
+
+    def model_layout(self, states):
+        """
+        Convert batch of channels-first planes into network layout.
+        """
+
+        if self.data_format == "channels_last":
+            return np.ascontiguousarray(np.moveaxis(states, 1, -1))
+
+        return states
 
     def num_moves(self):
         return self.board_size * self.board_size + 1
@@ -97,4 +196,7 @@ class Encoder():
         return move
 
     def shape(self):
+        if self.data_format == "channels_last":
+            return self.board_size, self.board_size, self.num_planes
+
         return self.num_planes, self.board_size, self.board_size
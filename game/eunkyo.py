@@ -4,16 +4,17 @@ This module implements the Eunkyo Go agent and move tree structure.
 
 """
 
-from agents            import Agent
-from encoder           import Encoder
-from keras.optimizers  import SGD
-from utils.keras_utils import load_model_from_hdf5_group
-from utils.keras_utils import save_model_to_hdf5_group
+from agents         import Agent
+from encoder        import Encoder
+from utils.symmetry import NUM_SYMMETRIES
+from utils.symmetry import restore_policies
+from utils.symmetry import transform_states
 
 import numpy as np
 
 import h5py
 import os
+import pipeline
 
 
 class Branch():
@@ -113,27 +114,91 @@ class TreeNode:
 ##################################################
 
 class EunkyoAgent(Agent):
-    def __init__(self, model, encoder, rounds = 1000, ee = 3.0):
+    """
+    Model is evaluated through predictor, any callable mapping batch of encoded board tensors to
+    (priors, values) NumPy arrays. By default, forward pass of model is compiled once (optionally
+    with XLA) instead of dispatching Keras layers on every call. Evaluations can be shared through
+    cache (see evaluation_cache.py), which agents playing same network may share.
+
+    With symmetries above 1, each position is evaluated in that many randomly chosen board
+    orientations within one batched call, and outputs are averaged on original board.
+    """
+
+    def __init__(self, model, encoder, rounds = 1000, ee = 3.0, predictor = None, xla = False,
+                 cache = None, symmetries = 1, model_loader = None):
+        from inference import CompiledModel
+
+        if not 1 <= symmetries <= NUM_SYMMETRIES:
+            raise ValueError("Number of symmetries must be between 1 and {0}".format(
+                NUM_SYMMETRIES
+            ))
+
         self.ee         = ee
+        self.cache      = cache
         self.collector  = None
         self.encoder    = encoder
-        self.model      = model
         self.num_rounds = rounds
+        self.predictor  = predictor if predictor is not None else CompiledModel(model, xla)
+        self.symmetries = symmetries
+        self.xla        = xla
+
+        self._model       = model
+        self.model_loader = model_loader  # loads trainable model on first use, if model is None
+
+    def evaluate(self, planes):
+        """
+        Evaluate channels-first planes of one position and return (priors, value).
+        """
+
+        priors, values = self.evaluate_batch(planes[np.newaxis])
+
+        return priors[0], float(values[0])
+
+    def evaluate_batch(self, planes):
+        """
+        Evaluate batch of channels-first planes in one model call and return (priors, values)
+        arrays. With symmetries above 1, batch holds that many orientations of every position.
+        """
+
+        if self.symmetries == 1:
+            # Current version of model.predict() suffers memory leak, so compiled predictor is used.
+            priors, values = self.predictor(self.encoder.model_layout(planes))
+
+            return np.asarray(priors), np.asarray(values).reshape(-1)
+
+        num_positions = planes.shape[0]
+        symmetries    = np.concatenate([
+            np.random.choice(NUM_SYMMETRIES, self.symmetries, replace = False)
+            for _ in range(num_positions)
+        ])
+
+        model_input = transform_states(np.repeat(planes, self.symmetries, axis = 0), symmetries)
+
+        priors, values = self.predictor(self.encoder.model_layout(model_input))
+
+        priors = restore_policies(np.asarray(priors), symmetries, self.encoder.board_size)
+        priors = priors.reshape((num_positions, self.symmetries, -1)).mean(axis = 1)
+        values = np.asarray(values).reshape((num_positions, self.symmetries)).mean(axis = 1)
 
-    def new_node(self, game_state, move = None, parent = None):
+        return priors, values
+
+    @property
+    def model(self):
         """
-        Create new node and add to parent (if exists).
+        Trainable model, or None for agents that cannot be trained. Agents loaded from file play
+        with inference model and load trainable model only when it is first needed.
         """
 
-        state_tensor = self.encoder.encode_board(game_state)
-        model_input  = np.array([state_tensor])
+        if self._model is None and self.model_loader is not None:
+            self._model       = self.model_loader()
+            self.model_loader = None
 
-        # Current version of model.predict() suffers memory leak.
-        # priors, values = self.model.predict(model_input, verbose = 0)
-        priors, values = self.model(model_input)
+        return self._model
 
-        priors = priors[0]
-        value  = values[0][0]
+    def new_node(self, game_state, priors, value, move = None, parent = None):
+        """
+        Create new node from network evaluation of game_state and add to parent (if exists).
+        """
 
         # Add Dirichlet noise, with concentration of 0.05, to root node to introduce randomness in
         # search process. Modify priors as weighted average of true priors and noise.
@@ -142,10 +207,8 @@ class EunkyoAgent(Agent):
             priors = 0.75 * priors + 0.25 * noise
 
         # Unpack priors vector into dictionary mapping move objects to corresponding
-        # prior probabilities.
-        move_priors = {
-            self.encoder.decode_move_index(i): prior for i, prior in enumerate(priors)
-        }
+        # prior probabilities. Encoder move table is ordered by vector index.
+        move_priors = dict(zip(self.encoder.index_moves, priors.tolist()))
 
         node = TreeNode(game_state, value, move_priors, parent, move)
 
@@ -154,31 +217,17 @@ class EunkyoAgent(Agent):
 
         return node
 
-    def select_branch(self, node):
-        """
-        Choose branch to traverse according to AlphaGo Zero scoring function based on:
-          1) number of times branch has already been visited
-          2) estimated value of branch
-          3) prior probability of move
-        """
-
-        total_visits = node.total_visit_count
-
-        def score_branch(move):
-            n = node.visit_count(move)
-            p = node.prior(move)
-            q = node.expected_value(move)
-
-            return q + self.ee * p * np.sqrt(total_visits) / (n + 1)
-
-        return max(node.valid_moves(), key = score_branch)
-
-    def select_move(self, game_state):
+    def search(self, game_state, collector = None):
         """
-        Traverse game tree to find optimal move to play.
+        Traverse game tree to find optimal move to play. Search runs as generator: it yields
+        channels-first planes of every position it needs evaluated, expects (priors, value) back
+        through send() and returns selected move. Searches of many games can thus wait on one
+        batched evaluation (see lockstep.py).
         """
 
-        root = self.new_node(game_state)
+        root_planes   = self.encoder.encode_planes(game_state)
+        priors, value = yield root_planes
+        root          = self.new_node(game_state, priors, value)
 
         # Each round adds new board position to tree. More rounds per move make tree grow
         # larger (either in breadth or depth) and lead to better moves.
@@ -186,15 +235,21 @@ class EunkyoAgent(Agent):
             node      = root
             next_move = self.select_branch(node)
 
-            # Repeat branch selection until leaf node is reached.
-            while node.has_child(next_move):
+            # Repeat branch selection until leaf node (or finished game) is reached.
+            while node.has_child(next_move) and not node.get_child(next_move).state.is_over():
                 node      = node.get_child(next_move)
                 next_move = self.select_branch(node)
 
-            # At leaf node, create new node to expand tree.
-            new_state  = node.state.play_move(next_move)
-            child_node = self.new_node(new_state, parent = node)
-            move       = next_move
+            if node.has_child(next_move):
+                # Finished game cannot be expanded; visit its node again.
+                child_node = node.get_child(next_move)
+            else:
+                # At leaf node, create new node to expand tree.
+                new_state     = node.state.play_move(next_move)
+                priors, value = yield self.encoder.encode_planes(new_state)
+                child_node    = self.new_node(new_state, priors, value, next_move, node)
+
+            move = next_move
 
             # Switch player perspective at each level of tree.
             # Good move for Black means bad move for White and vice versa.
@@ -208,42 +263,116 @@ class EunkyoAgent(Agent):
                 node  = node.parent
                 value = -1 * value
 
-        if self.collector is not None:
-            root_state_tensor = self.encoder.encode_board(game_state)
+        if collector is not None:
+            # Scatter visit counts of expanded branches into vector indexed by encoded move.
+            moves        = list(root.valid_moves())
+            visit_counts = np.zeros(self.encoder.num_moves())
+
+            visit_counts[self.encoder.encode_moves(moves)] = [root.visit_count(m) for m in moves]
 
-            visit_counts = np.array(
-                [root.visit_count(self.encoder.decode_move_index(i))
-                 for i in range(self.encoder.num_moves())]
+            # Position key lets duplicate positions across games be aggregated later. Equal keys
+            # mean equal planes: board and player to move fix all planes but ko.
+            position_key = (
+                game_state.board.zobrist_hash(), game_state.next_player.value,
+                self.encoder.ko_key(root_planes)
             )
 
-            self.collector.record_decision(root_state_tensor, visit_counts)
+            collector.record_decision(root_planes, visit_counts, position_key)
 
         return max(root.valid_moves(), key = root.visit_count)
 
+    def select_branch(self, node):
+        """
+        Choose branch to traverse according to AlphaGo Zero scoring function based on:
+          1) number of times branch has already been visited
+          2) estimated value of branch
+          3) prior probability of move
+        """
+
+        total_visits = node.total_visit_count
+
+        def score_branch(move):
+            n = node.visit_count(move)
+            p = node.prior(move)
+            q = node.expected_value(move)
+
+            return q + self.ee * p * np.sqrt(total_visits) / (n + 1)
+
+        return max(node.valid_moves(), key = score_branch)
+
+    def select_move(self, game_state):
+        """
+        Run search, evaluating each position as soon as search reaches it.
+        """
+
+        search = self.search(game_state, self.collector)
+        planes = next(search)
+
+        while True:
+            if self.cache is None:
+                evaluation = self.evaluate(planes)
+            else:
+                evaluation = self.cache.evaluate(planes, self.evaluate)
+
+            try:
+                planes = search.send(evaluation)
+            except StopIteration as stop:
+                return stop.value
+
     def serialize(self, h5file):
+        """
+        Save trainable model and, next to it, inference-only model with batch normalization folded
+        into preceding layers and dropout removed.
+        """
+
+        from inference         import build_inference_model
+        from utils.keras_utils import save_model_to_hdf5_group
+
         h5file.create_group("encoder")
+        h5file.create_group("inference")
         h5file.create_group("model")
 
-        h5file["encoder"].attrs["board_size"] = self.encoder.board_size
+        h5file["encoder"].attrs["board_size"]  = self.encoder.board_size
+        h5file["encoder"].attrs["data_format"] = self.encoder.data_format
 
         save_model_to_hdf5_group(self.model, h5file["model"])
+        save_model_to_hdf5_group(build_inference_model(self.model), h5file["inference"])
+
+    def set_cache(self, cache):
+        self.cache = cache
 
     def set_collector(self, collector):
         self.collector = collector
 
-    def train(self, exp):
+    def train(self, exp, batch_size = 512, augment = True, targets = None, prefix = "eunkyo"):
         """
         Training target for action output is number of visits made for each move in tree search.
         Training target for value output is 1 if agent won and -1 if agent lost.
+
+        Unless disabled, every mini-batch is augmented with random board symmetries, so that each
+        self-play position is seen in any of its eight equivalent orientations.
+
+        Targets, if given, replaces these targets, e.g. with teacher network outputs (see
+        pipeline.distillation_targets()). Trained agent is saved under prefix and path of saved file
+        is returned.
         """
 
-        model_input  = exp.states
-        num_examples = exp.states.shape[0]
-        value_target = exp.rewards
+        if self.model is None:
+            raise ValueError("Exported agent cannot be trained; train agent it was exported from")
+
+        # Keras is imported on first use so that scripts importing this module start quickly.
+        from inference        import CompiledModel
+        from inference        import build_inference_model
+        from keras.optimizers import SGD
+
+        num_examples = exp.num_examples
 
-        # Track number of times each move is visited during self-play and normalize.
-        visit_sums    = np.sum(exp.visit_counts, axis = 1).reshape((num_examples, 1))
-        action_target = exp.visit_counts / visit_sums
+        # Experience may be in memory (ExperienceBuffer) or streamed from disk (ExperienceStream).
+        # Batches are prepared on background thread while model trains on previous ones.
+        batches = pipeline.prefetch(pipeline.training_batches(
+            exp.batches(batch_size), augment = augment, layout = self.encoder.model_layout,
+            targets = targets
+        ))
 
         self.model.summary()
 
@@ -255,11 +384,22 @@ class EunkyoAgent(Agent):
             optimizer = SGD(decay = 0.01, learning_rate = 0.01, momentum = 0.9)
         )
 
-        self.model.fit(
-            model_input, [action_target, value_target], batch_size = 512, epochs = 1
-        )
+        # Close batches so that background thread stops and releases experience files even if
+        # fit() stops early or raises.
+        try:
+            self.model.fit(
+                batches, steps_per_epoch = int(np.ceil(num_examples / batch_size)), epochs = 1
+            )
+        finally:
+            batches.close()
+
+        # Play on with folded copy of trained weights; cached evaluations are stale.
+        self.predictor = CompiledModel(build_inference_model(self.model), self.xla)
 
-        agent_out  = "./outputs/agent/eunkyo"
+        if self.cache is not None:
+            self.cache.clear()
+
+        agent_out  = "./outputs/agent/" + prefix
         agent_out += "_b" + str(self.encoder.board_size)
         agent_out += "_g" + str(exp.game_count + 1)
         agent_out += "_r" + str(self.num_rounds)
@@ -272,9 +412,94 @@ class EunkyoAgent(Agent):
         with h5py.File(agent_out, "w") as h5:
             self.serialize(h5)
 
-def load_agent(h5file, rounds = 1000):
+        return agent_out
+
+    def warm_up(self, batch_sizes = None):
+        """
+        Evaluate dummy batches so that graph tracing and memory allocation happen now rather than
+        during first move. By default, batch evaluated per position is warmed up.
+        """
+
+        if batch_sizes is None:
+            batch_sizes = (self.symmetries,)
+
+        for batch_size in batch_sizes:
+            self.predictor(np.zeros((batch_size,) + self.encoder.shape(), dtype = np.float32))
+
+def load_agent(h5file, rounds = 1000, xla = False, symmetries = 1, shared = True):
+    """
+    Load agent from file. Exported agents (see export_agent.py) hold NumPy network instead of Keras
+    model and quantized agents (see quantize_agent.py) hold int8 TensorFlow Lite model; they play
+    without trainable model and cannot be trained.
+
+    Unless shared is unset, inference model is shared with other agents loaded from same file
+    (see utils.keras_utils.load_model_from_hdf5_group()). Trainable model is never shared.
+    """
+
     board_size   = h5file["encoder"].attrs["board_size"]
-    game_encoder = Encoder(board_size)
-    model        = load_model_from_hdf5_group(h5file["model"])
+    data_format  = h5file["encoder"].attrs.get("data_format", "channels_first")
+    game_encoder = Encoder(board_size, data_format)
+
+    if "network" in h5file:
+        from inference import load_network
+
+        predictor = load_network(h5file["network"])
+        agent     = EunkyoAgent(
+            None, game_encoder, rounds, predictor = predictor, symmetries = symmetries
+        )
+    elif "quantized" in h5file:
+        from inference import load_quantized
+
+        predictor = load_quantized(h5file["quantized"])
+        agent     = EunkyoAgent(
+            None, game_encoder, rounds, predictor = predictor, symmetries = symmetries
+        )
+    else:
+        from inference         import CompiledModel
+        from utils.keras_utils import load_model_from_hdf5_group
+
+        # Agents saved with folded inference model play with it and load trainable model only for
+        # training; older agents play with trainable model. Inference model is never trained, so
+        # agents loaded from same file may share it.
+        if "inference" in h5file:
+            model        = None
+            model_loader = trainable_model_loader(h5file.filename)
+            predictor    = CompiledModel(
+                load_model_from_hdf5_group(h5file["inference"], shared = shared), xla
+            )
+        else:
+            model        = load_model_from_hdf5_group(h5file["model"])
+            model_loader = None
+            predictor    = None
+
+        agent = EunkyoAgent(
+            model, game_encoder, rounds, predictor = predictor, xla = xla, symmetries = symmetries,
+            model_loader = model_loader
+        )
+
+    # Trace and allocate now, not during first move.
+    agent.warm_up()
+
+    return agent
+
+def trainable_model_loader(file_name):
+    """
+    Return function that loads trainable model of agent file. File is reopened only for loading,
+    and loader refuses file that was modified since agent was loaded, since it would hold model of
+    different agent.
+    """
+
+    from utils.keras_utils import load_model_from_hdf5_group
+
+    mtime = os.path.getmtime(file_name)
+
+    def load_model():
+        if os.path.getmtime(file_name) != mtime:
+            raise ValueError("Agent file {0} was modified after agent was loaded!".format(
+                file_name
+            ))
+
+        with h5py.File(file_name, "r") as h5file:
+            return load_model_from_hdf5_group(h5file["model"])
 
-    return EunkyoAgent(model, game_encoder, rounds)
+    return load_model
@@ -4,23 +4,137 @@ This module implements Go agent evaluation using game simulation.
 
 """
 
-from datetime      import datetime
-from eunkyo        import load_agent
-from go_board_fast import GameState
-from go_board_fast import Player
-from utils.play_io import print_board
-from utils.score   import compute_result
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime           import datetime
+from eunkyo             import load_agent
+from evaluation_cache   import EvaluationCache
+from go_board_fast      import GameState
+from go_board_fast      import Player
+from utils.elo          import elo_estimate
+from utils.elo          import sprt_bounds
+from utils.elo          import sprt_llr
+from utils.play_io      import print_board
+from utils.runtime      import add_runtime_arguments
+from utils.runtime      import configure_runtime_from_args
+from utils.runtime      import configure_worker_runtime
+from utils.score        import compute_result
 
 import argparse
 import h5py
+import multiprocessing
 import os
 import sys
+import time
 
 
 # Disable TensorFlow warnings.
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 
+worker_state = {}  # arguments and agents of worker process, set once by init_worker()
+
+def evaluate_game(agent_1, agent_2, index, board_size, display = False):
+    """
+    Play game index, agent_1 taking black in even games and white in odd ones, and return whether
+    agent_1 won and game time in seconds.
+    """
+
+    player     = Player.black if index % 2 == 0 else Player.white
+    game_start = time.perf_counter()
+
+    if player == Player.black:
+        winner = simulate_game(agent_1, agent_2, board_size, display)
+    else:
+        winner = simulate_game(agent_2, agent_1, board_size, display)
+
+    return winner == player, time.perf_counter() - game_start
+
+def evaluate_games(args, agent_1, agent_2):
+    """
+    Play games one after another and yield (index, won, seconds) for each.
+    """
+
+    for i in range(args.sims):
+        print("[-] Game {0} / {1}".format(i + 1, args.sims))
+
+        yield (i,) + evaluate_game(agent_1, agent_2, i, args.board, args.disp)
+
+def evaluate_games_in_workers(args):
+    """
+    Play games in args.workers processes, each loading both agents once, and yield (index, won,
+    seconds) in order games finish. Colors follow game index, so they stay balanced however games
+    are spread over workers. Games not yet started are cancelled once generator is closed.
+    """
+
+    # Workers start from fresh interpreters, since TensorFlow does not survive fork. Each takes
+    # next number from counter, which selects its share of cores.
+    context  = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(
+        args.workers, mp_context = context, initializer = init_worker,
+        initargs = (args, context.Value("i", 0))
+    )
+
+    try:
+        futures = {executor.submit(play_worker_game, i): i for i in range(args.sims)}
+
+        for future in as_completed(futures):
+            i = futures[future]
+
+            print("[-] Game {0} / {1} finished".format(i + 1, args.sims))
+
+            yield (i,) + future.result()
+    finally:
+        executor.shutdown(cancel_futures = True)
+
+def in_index_order(games):
+    """
+    Yield (index, won, seconds) results of games in game index order, holding back games that
+    finish before earlier ones. Sequential test then sees same sequence of results however games
+    are spread over workers.
+    """
+
+    pending = {}
+    index   = 0
+
+    for game in games:
+        pending[game[0]] = game
+
+        while index in pending:
+            yield pending.pop(index)
+
+            index += 1
+
+def init_worker(args, counter):
+    with counter.get_lock():
+        worker         = counter.value
+        counter.value += 1
+
+    configure_worker_runtime(args, worker, args.workers)
+
+    worker_state["args"]   = args
+    worker_state["agents"] = load_agents(args)
+
+def load_agents(args):
+    """
+    Load challenger and champion agents, each with own evaluation cache if enabled, since they play
+    different networks.
+    """
+
+    agents = [
+        load_agent(
+            h5py.File("./outputs/agent/" + agent + ".h5", "r"), args.rounds, args.xla,
+            args.symmetries
+        )
+        for agent in (args.agent, args.oppo)
+    ]
+
+    if args.cache:
+        for agent in agents:
+            agent.set_cache(EvaluationCache(args.board, agent.encoder.num_planes, args.cache))
+
+    return agents
+
 def parse_args():
     parser = argparse.ArgumentParser(
         usage = "python " + sys.argv[0] + " -a agent -o opponent -s 10"
@@ -49,11 +163,63 @@ def parse_args():
 
     parser.add_argument(
         "-s", "--sims", default = 1, type = int,
-        help = "number of games to simulate (default = 1)"
+        help = "number of games to simulate; with --sprt, maximum number of games (default = 1)"
+    )
+
+    parser.add_argument(
+        "--alpha", default = 0.05, type = float,
+        help = "SPRT probability of accepting elo1 when elo0 holds (default = 0.05)"
+    )
+
+    parser.add_argument(
+        "--beta", default = 0.05, type = float,
+        help = "SPRT probability of accepting elo0 when elo1 holds (default = 0.05)"
     )
 
+    parser.add_argument(
+        "--cache", default = 0, type = int,
+        help = "number of positions kept in symmetry-aware evaluation cache (default = 0, off)"
+    )
+
+    parser.add_argument(
+        "--elo0", default = 0.0, type = float,
+        help = "SPRT null hypothesis: Elo difference of challenger over champion (default = 0)"
+    )
+
+    parser.add_argument(
+        "--elo1", default = 35.0, type = float,
+        help = "SPRT alternative hypothesis: Elo difference of challenger over champion "
+               "(default = 35)"
+    )
+
+    parser.add_argument(
+        "--sprt", action = "store_true",
+        help = "stop as soon as sequential probability ratio test accepts elo0 or elo1"
+    )
+
+    parser.add_argument(
+        "--symmetries", default = 1, type = int,
+        help = "board orientations averaged per position evaluation, 1-8 (default = 1)"
+    )
+
+    parser.add_argument(
+        "--workers", default = 1, type = int,
+        help = "number of processes playing games in parallel (default = 1)"
+    )
+
+    parser.add_argument(
+        "--xla", action = "store_true", help = "compile model inference with XLA"
+    )
+
+    add_runtime_arguments(parser)
+
     return parser.parse_args()
 
+def play_worker_game(index):
+    args = worker_state["args"]
+
+    return evaluate_game(*worker_state["agents"], index, args.board, args.disp)
+
 def simulate_game(agent_black, agent_white, board_size, display = False):
     agents = {
         Player.black: agent_black,
@@ -85,48 +251,83 @@ def main():
     # Configure command line argument parser.
     args = parse_args()
 
-    board_size = args.board
-    display    = args.disp
-    rounds     = args.rounds
-    sims       = args.sims
+    # Pin cores and size thread pools before TensorFlow is loaded.
+    configure_runtime_from_args(args)
 
-    agent_1 = load_agent(h5py.File("./outputs/agent/" + args.agent + ".h5", "r"), rounds)
-    agent_2 = load_agent(h5py.File("./outputs/agent/" + args.oppo  + ".h5", "r"), rounds)
+    if args.sprt and not args.elo0 < args.elo1:
+        raise ValueError("SPRT needs elo0 below elo1")
 
-    losses = 0
-    wins   = 0
+    if args.sprt and not (0 < args.alpha < 1 and 0 < args.beta < 1):
+        raise ValueError("SPRT needs alpha and beta between 0 and 1")
 
-    player = Player.black
+    if args.sprt:
+        llr_lower, llr_upper = sprt_bounds(args.alpha, args.beta)
 
     print("[+] Running game simulations ...\n")
 
-    eval_start = datetime.now()  # evaluation start time
+    if args.workers > 1:
+        games = evaluate_games_in_workers(args)
+    else:
+        agent_1, agent_2 = load_agents(args)
 
-    for i in range(sims):
-        print("[-] Game {0} / {1}".format(i + 1, sims))
+        games = evaluate_games(args, agent_1, agent_2)
 
-        if player == Player.black:
-            player_black = agent_1
-            player_white = agent_2
-        else:
-            player_black = agent_2
-            player_white = agent_1
+    losses    = 0
+    wins      = 0
+    game_time = 0.0  # seconds spent in games, summed over workers
+    decision  = None
 
-        winner = simulate_game(player_black, player_white, board_size, display)
+    eval_start = datetime.now()  # evaluation start time
 
-        if winner == player:
+    for _, won, seconds in in_index_order(games):
+        if won:
             wins += 1
         else:
             losses += 1
 
-        # Swap colors after each game in case either agent plays better with particular color.
-        player = player.other
+        game_time += seconds
+
+        if args.sprt:
+            llr = sprt_llr(wins, losses, args.elo0, args.elo1)
+
+            print("    LLR {0:+.2f} ({1:+.2f}, {2:+.2f})".format(llr, llr_lower, llr_upper))
+
+            if llr >= llr_upper:
+                decision = "elo1"
+            elif llr <= llr_lower:
+                decision = "elo0"
+
+            if decision is not None:
+                break
+
+    # Cancel games not yet started.
+    games.close()
+
+    eval_time = datetime.now() - eval_start
 
-    if not display:
+    if not args.disp:
         print()
 
     print("[+] Total wins: {0} / {1}".format(wins, losses + wins))
-    print("\n[+] Evaluation time: {0}".format(datetime.now() - eval_start))
+    print("[+] Elo difference: {0:+.0f} (95% confidence interval {1:+.0f} to {2:+.0f})".format(
+        *elo_estimate(wins, losses)
+    ))
+
+    if decision is not None:
+        print("[+] SPRT: accepted {0} = {1:+.0f} after {2} game(s)".format(
+            decision, getattr(args, decision), wins + losses
+        ))
+    elif args.sprt:
+        print("[+] SPRT: undecided after {0} game(s)".format(wins + losses))
+
+    if args.cache and args.workers <= 1:
+        print("[+] Evaluation cache: {0:.1%} / {1:.1%} hit rate".format(
+            agent_1.cache.hit_rate(), agent_2.cache.hit_rate()
+        ))
+    print("\n[+] Evaluation time: {0}".format(eval_time))
+    print("[+] Game time: {0:.1f} s per game, {1:.1f} game(s) in progress on average".format(
+        game_time / max(wins + losses, 1), game_time / max(eval_time.total_seconds(), 1e-9)
+    ))
 
 if __name__ == "__main__":
     main()
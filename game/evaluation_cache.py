@@ -0,0 +1,119 @@
+"""
+
+This module implements cache of network evaluations shared by tree searches. Rotated and mirrored
+positions share one entry: each position is hashed under all eight board symmetries with Zobrist
+keys, smallest hash names canonical form, and network output is stored in canonical orientation and
+mapped back through inverse transform on every hit.
+
+"""
+
+from collections    import OrderedDict
+from utils.symmetry import NUM_SYMMETRIES
+from utils.symmetry import move_permutations
+
+import numpy as np
+
+
+class EvaluationCache():
+    """
+    Least recently used cache mapping encoded positions to (priors, value) network outputs. Keys
+    cover every input plane (stones and liberties, player to move, ko), so equal keys mean equal
+    network inputs up to symmetry. With symmetric unset, only exact positions are matched.
+    """
+
+    def __init__(self, board_size, num_planes, capacity = 65536, symmetric = True, seed = 0):
+        num_points   = board_size * board_size
+        num_symmetry = NUM_SYMMETRIES if symmetric else 1
+        permutations = move_permutations(board_size)[:num_symmetry]
+        rng          = np.random.default_rng(seed)
+
+        keys    = rng.integers(np.iinfo(np.uint64).max, size = (num_planes, num_points),
+                               dtype = np.uint64)
+        inverse = np.argsort(permutations[:, :num_points], axis = 1)
+
+        # Stone on point j of position is on point inverse[s, j] of position transformed by s, so
+        # row s of hash_keys hashes transformed position without transforming planes.
+        self.hash_keys    = keys[:, inverse].transpose(1, 0, 2).reshape(num_symmetry, -1)
+        self.permutations = permutations
+
+        self.capacity = capacity
+        self.entries  = OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+
+    def _canonical(self, planes):
+        """
+        Return key of canonical form of planes and symmetry taking planes to it.
+        """
+
+        hashes   = np.bitwise_xor.reduce(self.hash_keys[:, np.flatnonzero(planes)], axis = 1)
+        symmetry = int(np.argmin(hashes))
+
+        return int(hashes[symmetry]), symmetry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """
+        Drop all entries, e.g. after network weights changed.
+        """
+
+        self.entries.clear()
+
+    def evaluate(self, planes, evaluate):
+        """
+        Return (priors, value) for channels-first planes of one position, calling evaluate(planes)
+        only if no symmetric equivalent is cached.
+        """
+
+        evaluation = self.lookup(planes)
+
+        if evaluation is None:
+            evaluation = evaluate(planes)
+
+            self.store(planes, *evaluation)
+
+        return evaluation
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, planes):
+        """
+        Return cached (priors, value) for planes, mapped onto their orientation, or None. Returned
+        priors array is never shared with cache.
+        """
+
+        key, symmetry = self._canonical(planes)
+        entry         = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        self.entries.move_to_end(key)
+
+        canonical_priors, value = entry
+
+        priors = np.empty_like(canonical_priors)
+
+        priors[self.permutations[symmetry]] = canonical_priors
+
+        return priors, value
+
+    def store(self, planes, priors, value):
+        key, symmetry = self._canonical(planes)
+
+        # Store priors in orientation of canonical position.
+        self.entries[key] = (np.asarray(priors)[self.permutations[symmetry]], value)
+
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
@@ -5,63 +5,330 @@ This module implements the experience mechanism for reinforcement learning.
 """
 
 import numpy as np
+import pipeline
 
 
+# Position key columns: Zobrist hash of board, player to move and digest of ko plane. Keys of other
+# width were written before ko was part of key and are ignored.
+KEY_COLUMNS = 3
+
 class ExperienceBuffer(object):
-    def __init__(self, game_count, states, visit_counts, rewards):
+    """
+    Optional weights count how many recorded positions each row stands for (1 unless duplicate
+    positions were aggregated). Optional keys identify position of each row as (Zobrist hash,
+    player to move, ko digest).
+    """
+
+    def __init__(self, game_count, states, visit_counts, rewards, weights = None, keys = None):
         self.game_count   = game_count
+        self.keys         = keys
         self.states       = states
         self.visit_counts = visit_counts
         self.rewards      = rewards
 
-    def serialize(self, h5file):
+        if weights is None:
+            weights = np.ones(len(rewards), dtype = np.float32)
+
+        self.weights = weights
+
+    def batches(self, batch_size, rng = None):
+        """
+        Yield shuffled (states, visit_counts, rewards, weights) mini-batches indefinitely.
+        """
+
+        return pipeline.array_batches(
+            (self.states, self.visit_counts, self.rewards, self.weights), batch_size, rng
+        )
+
+    @property
+    def num_examples(self):
+        return self.states.shape[0]
+
+    def serialize(self, h5file, compression = None):
         h5file.create_group("experience")
         h5file.create_group("game")
 
-        h5file["experience"].create_dataset("states",       data = self.states)
-        h5file["experience"].create_dataset("visit_counts", data = self.visit_counts)
-        h5file["experience"].create_dataset("rewards",      data = self.rewards)
+        fields = [
+            ("states",       self.states),
+            ("visit_counts", self.visit_counts),
+            ("rewards",      self.rewards),
+            ("weights",      self.weights)
+        ]
+
+        if self.keys is not None:
+            fields.append(("keys", self.keys))
+
+        for name, data in fields:
+            h5file["experience"].create_dataset(name, data = data, compression = compression)
 
         h5file["game"].attrs["count"] = self.game_count
 
+class ExperienceStream(object):
+    """
+    Experience spread over one or more HDF5 files that is streamed from disk in contiguous blocks
+    rather than loaded into memory. Files must stay open while batches are drawn; close() closes
+    them once training is done.
+    """
+
+    def __init__(self, h5files, block_size = 1024, buffer_size = 16384):
+        self.block_size  = block_size
+        self.buffer_size = buffer_size
+        self.h5files     = list(h5files)
+
+        # Game count attribute holds index of last game simulated.
+        self.game_count = sum(h5["game"].attrs["count"] + 1 for h5 in self.h5files) - 1
+
+    def batches(self, batch_size, rng = None):
+        """
+        Yield shuffled (states, visit_counts, rewards, weights) mini-batches indefinitely.
+        """
+
+        blocks = []
+
+        for i, h5 in enumerate(self.h5files):
+            num_rows = h5["experience"]["states"].shape[0]
+
+            for start in range(0, num_rows, self.block_size):
+                blocks.append((i, start, min(start + self.block_size, num_rows)))
+
+        return pipeline.buffered_batches(
+            self.read_block, blocks, batch_size, max(self.buffer_size, batch_size), rng
+        )
+
+    def close(self):
+        for h5 in self.h5files:
+            h5.close()
+
+        self.h5files = []
+
+    @property
+    def num_examples(self):
+        return sum(h5["experience"]["states"].shape[0] for h5 in self.h5files)
+
+    def read_block(self, block):
+        i, start, stop = block
+
+        return read_rows(self.h5files[i]["experience"], start, stop)
+
+class ExperienceWriter(object):
+    """
+    Append experience rows to open HDF5 file chunk by chunk, growing resizable datasets, so that
+    arbitrarily large experience can be written without holding it in memory. File already written
+    by ExperienceWriter is appended to; rows written after its last close() are dropped.
+    """
+
+    def __init__(self, h5file, compression = None, chunk_rows = 256):
+        self.chunk_rows  = chunk_rows
+        self.compression = compression
+        self.h5file      = h5file
+        self.num_games   = 0
+        self.num_rows    = 0
+
+        if "experience" in h5file:
+            experience = h5file["experience"]
+
+            self.num_games = int(h5file["game"].attrs["count"]) + 1
+            self.num_rows  = int(experience.attrs["rows"])
+
+            # Drop rows of write interrupted before close().
+            for dataset in experience.values():
+                dataset.resize(self.num_rows, axis = 0)
+
+            return
+
+        h5file.create_group("experience")
+        h5file.create_group("game")
+
+        self.close()
+
+    def close(self):
+        """
+        Record games and rows written so far and flush file. Rows count only once recorded here.
+        """
+
+        # Game count attribute holds index of last game simulated.
+        self.h5file["game"].attrs["count"]      = self.num_games - 1
+        self.h5file["experience"].attrs["rows"] = self.num_rows
+
+        self.h5file.flush()
+
+    @property
+    def has_keys(self):
+        """
+        Whether every row written so far has position key (see aggregate_positions()).
+        """
+
+        experience = self.h5file["experience"]
+
+        return self.num_rows == 0 or (
+            "keys" in experience and experience["keys"].shape[1:] == (KEY_COLUMNS,)
+        )
+
+    def write_rows(self, states, visit_counts, rewards, weights = None, num_games = 0,
+                   keys = None):
+        experience = self.h5file["experience"]
+        num_rows   = len(states)
+
+        if weights is None:
+            weights = np.ones(num_rows, dtype = np.float32)
+
+        fields = [
+            ("states",       states),
+            ("visit_counts", visit_counts),
+            ("rewards",      rewards),
+            ("weights",      weights)
+        ]
+
+        # Position keys are kept only if every row has one.
+        if keys is not None and self.has_keys:
+            fields.append(("keys", keys))
+        elif "keys" in experience:
+            del experience["keys"]
+
+        for name, rows in fields:
+            rows = np.asarray(rows)
+
+            if name not in experience:
+                experience.create_dataset(
+                    name, shape = (0,) + rows.shape[1:], maxshape = (None,) + rows.shape[1:],
+                    dtype = rows.dtype, chunks = (self.chunk_rows,) + rows.shape[1:],
+                    compression = self.compression
+                )
+
+            dataset = experience[name]
+
+            dataset.resize(self.num_rows + num_rows, axis = 0)
+
+            dataset[self.num_rows:self.num_rows + num_rows] = rows
+
+        self.num_games += num_games
+        self.num_rows  += num_rows
+
 class ExperienceCollector():
     def __init__(self):
+        self._current_episode_keys         = []
         self._current_episode_states       = []
         self._current_episode_visit_counts = []
+        self.keys                          = []
         self.states                        = []
         self.visit_counts                  = []
         self.rewards                       = []
 
     def begin_episode(self):
+        self._current_episode_keys         = []
         self._current_episode_states       = []
         self._current_episode_visit_counts = []
 
+    def clear(self):
+        """
+        Drop completed episodes once they have been written out.
+        """
+
+        self.keys         = []
+        self.states       = []
+        self.visit_counts = []
+        self.rewards      = []
+
     def complete_episode(self, reward):
         num_states = len(self._current_episode_states)
 
+        self.keys         += self._current_episode_keys
         self.states       += self._current_episode_states
         self.visit_counts += self._current_episode_visit_counts
         self.rewards      += [reward for _ in range(num_states)]
 
         # Reset episode buffers.
+        self._current_episode_keys         = []
         self._current_episode_states       = []
         self._current_episode_visit_counts = []
 
-    def record_decision(self, state, visit_counts):
+    def record_decision(self, state, visit_counts, key = None):
+        """
+        Key identifies position independently of its tensor, e.g. (Zobrist hash, player to move,
+        ko digest), and is needed to aggregate duplicate positions later.
+        """
+
+        if key is not None:
+            self._current_episode_keys.append(key)
+
         self._current_episode_states.append(state)
         self._current_episode_visit_counts.append(visit_counts)
 
+def aggregate_positions(exp):
+    """
+    Merge rows that share position key: visit counts are summed, rewards averaged and weights
+    summed, so that training on aggregated rows with weights gives same loss as original rows.
+    Rows sharing key have same tensor, and tensor of first occurrence is kept.
+    """
+
+    if exp.keys is None:
+        raise ValueError("Experience has no position keys to aggregate by!")
+
+    _, first, inverse = np.unique(exp.keys, axis = 0, return_index = True, return_inverse = True)
+
+    inverse  = inverse.reshape(-1)
+    num_rows = first.shape[0]
+
+    visit_counts = np.zeros((num_rows,) + exp.visit_counts.shape[1:])
+    weights      = np.bincount(inverse, weights = exp.weights, minlength = num_rows)
+    rewards      = np.bincount(inverse, weights = exp.weights * exp.rewards, minlength = num_rows)
+
+    np.add.at(visit_counts, inverse, exp.visit_counts)
+
+    return ExperienceBuffer(
+        exp.game_count, exp.states[first], visit_counts, rewards / weights,
+        weights.astype(np.float32), exp.keys[first]
+    )
+
 def combine_experience(game_count, collectors):
     combined_states       = np.concatenate([np.array(cl.states)       for cl in collectors])
     combined_visit_counts = np.concatenate([np.array(cl.visit_counts) for cl in collectors])
     combined_rewards      = np.concatenate([np.array(cl.rewards)      for cl in collectors])
 
-    return ExperienceBuffer(game_count, combined_states, combined_visit_counts, combined_rewards)
+    # Keep position keys only if every decision was recorded with one.
+    if all(len(cl.keys) == len(cl.states) for cl in collectors):
+        combined_keys = np.concatenate(
+            [np.array(cl.keys, dtype = np.int64).reshape((-1, KEY_COLUMNS)) for cl in collectors]
+        )
+    else:
+        combined_keys = None
+
+    return ExperienceBuffer(
+        game_count, combined_states, combined_visit_counts, combined_rewards, keys = combined_keys
+    )
 
 def load_experience(h5file):
+    experience = h5file["experience"]
+    keys       = None
+
+    if "keys" in experience and experience["keys"].shape[1:] == (KEY_COLUMNS,):
+        keys = np.array(experience["keys"])
+
     return ExperienceBuffer(
         game_count   = h5file["game"].attrs["count"],
-        states       = np.array(h5file["experience"]["states"]),
-        visit_counts = np.array(h5file["experience"]["visit_counts"]),
-        rewards      = np.array(h5file["experience"]["rewards"])
+        states       = np.array(experience["states"]),
+        visit_counts = np.array(experience["visit_counts"]),
+        rewards      = np.array(experience["rewards"]),
+        weights      = np.array(experience["weights"]) if "weights" in experience else None,
+        keys         = keys
+    )
+
+def read_rows(experience, start, stop):
+    """
+    Read rows [start, stop) of experience group as (states, visit_counts, rewards, weights).
+    Files written before aggregation support have unit weights.
+    """
+
+    rewards = experience["rewards"][start:stop]
+
+    if "weights" in experience:
+        weights = experience["weights"][start:stop]
+    else:
+        weights = np.ones(rewards.shape[0], dtype = np.float32)
+
+    return (
+        experience["states"][start:stop],
+        experience["visit_counts"][start:stop],
+        rewards,
+        weights
     )
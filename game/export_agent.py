@@ -0,0 +1,83 @@
+"""
+
+This module exports trained agents for inference. Batch normalization is folded into convolution
+and dense weights and dropout is removed. Network is evaluated with NumPy, without TensorFlow, or,
+with -k, saved as inference-only Keras model next to trainable model of agent.
+
+"""
+
+from datetime  import datetime
+from inference import build_inference_model
+from inference import export_network
+
+import argparse
+import h5py
+import os
+import sys
+
+
+# Disable TensorFlow warnings.
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage = "python " + sys.argv[0] + " -a agent -o exported")
+
+    parser.add_argument(
+        "-a", "--agent", required = True, type = str, help = "agent filename prefix"
+    )
+
+    parser.add_argument(
+        "-k", "--keras", action = "store_true",
+        help = "add folded Keras inference model to agent instead of exporting NumPy network"
+    )
+
+    parser.add_argument(
+        "-o", "--output", required = True, type = str, help = "exported agent filename prefix"
+    )
+
+    return parser.parse_args()
+
+def main():
+    print("\n========== Agent Export Module ==========\n")
+
+    args = parse_args()
+
+    from utils.keras_utils import load_model_from_hdf5_group
+    from utils.keras_utils import save_model_to_hdf5_group
+
+    print("[+] Exporting agent ...\n")
+
+    export_start = datetime.now()  # export start time
+
+    with h5py.File("./outputs/agent/" + args.agent + ".h5", "r") as agent_in, \
+         h5py.File("./outputs/agent/" + args.output + ".h5", "w") as agent_out:
+        model = load_model_from_hdf5_group(agent_in["model"])
+
+        agent_out.create_group("encoder")
+
+        for key, value in agent_in["encoder"].attrs.items():
+            agent_out["encoder"].attrs[key] = value
+
+        if args.keras:
+            inference_model = build_inference_model(model)
+
+            agent_in.copy("model", agent_out)
+            agent_out.create_group("inference")
+
+            save_model_to_hdf5_group(inference_model, agent_out["inference"])
+
+            num_exported = len(inference_model.layers)
+        else:
+            agent_out.create_group("network")
+
+            export_network(model, agent_out["network"])
+
+            num_exported = len(agent_out["network"].keys())
+
+        print("[+] Layers: {0} in model, {1} exported".format(len(model.layers), num_exported))
+
+    print("\n[+] Export time: {0}".format(datetime.now() - export_start))
+
+if __name__ == "__main__":
+    main()
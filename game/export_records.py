@@ -0,0 +1,52 @@
+"""
+
+This module replays game record files into regular experience files of encoded board tensors.
+
+"""
+
+from datetime    import datetime
+from game_record import export_records
+
+import argparse
+import h5py
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage = "python " + sys.argv[0] + " -i records -o exp")
+
+    parser.add_argument(
+        "-i", "--input", required = True, type = str, help = "game record filename prefix"
+    )
+
+    parser.add_argument(
+        "-o", "--output", required = True, type = str, help = "experience output filename prefix"
+    )
+
+    parser.add_argument(
+        "-w", "--workers", default = 0, type = int,
+        help = "number of processes replaying games (default = 0)"
+    )
+
+    return parser.parse_args()
+
+def main():
+    print("\n========== Game Record Export Module ==========\n")
+
+    args = parse_args()
+
+    if not os.path.exists("./outputs/exp"):
+        os.makedirs("./outputs/exp")
+
+    print("[+] Replaying game records ...\n")
+
+    export_start = datetime.now()  # export start time
+
+    with h5py.File("./outputs/exp/" + args.output + ".h5", "w") as h5:
+        export_records("./outputs/exp/" + args.input + ".h5", h5, args.workers)
+
+    print("[+] Export time: {0}".format(datetime.now() - export_start))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+
+This module implements the game record experience format. Instead of one encoded board tensor per
+position, each self-play game is stored as its move sequence, the root visit counts of every
+decision and the winner. Board tensors are regenerated on demand by replaying games, so records
+are orders of magnitude smaller and can be re-encoded with any encoder version.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from encoder            import Encoder
+from go_board_fast      import GameState
+from go_types           import Player
+
+import numpy as np
+
+import h5py
+import pipeline
+
+
+class GameRecorder():
+    """
+    Collector shared by both agents of self-play game. Decisions arrive in move order, so visit
+    counts line up with move sequence recovered from final game state.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+
+        self._current_visit_counts = []
+        self.moves                 = []
+        self.visit_counts          = []
+        self.winners               = []
+
+    def begin_episode(self):
+        self._current_visit_counts = []
+
+    def complete_game(self, game_state, winner):
+        moves = []
+
+        while game_state.previous_state is not None:
+            moves.append(game_state.last_move)
+
+            game_state = game_state.previous_state
+
+        moves.reverse()
+
+        if len(moves) != len(self._current_visit_counts):
+            raise ValueError("Game has {0} move(s) but {1} recorded decision(s)".format(
+                len(moves), len(self._current_visit_counts)
+            ))
+
+        self.moves.append(self.encoder.encode_moves(moves))
+        self.visit_counts.append(np.array(self._current_visit_counts))
+        self.winners.append(1 if winner == Player.black else -1)
+
+        self._current_visit_counts = []
+
+    def extend(self, recorder):
+        """
+        Append completed games of another recorder, e.g. one that recorded single lockstep game.
+        """
+
+        self.moves        += recorder.moves
+        self.visit_counts += recorder.visit_counts
+        self.winners      += recorder.winners
+
+    def record_decision(self, state, visit_counts, key = None):
+        self._current_visit_counts.append(visit_counts)
+
+    def serialize(self, h5file):
+        """
+        Store games as flat move array with per-game offsets. Visit counts are integers and mostly
+        zero, so they are stored compressed.
+        """
+
+        lengths = [len(moves) for moves in self.moves]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        h5file.create_group("records")
+        h5file.create_group("game")
+
+        records = h5file["records"]
+
+        records.attrs["board_size"] = self.encoder.board_size
+
+        records.create_dataset("moves",   data = np.concatenate(self.moves).astype(np.int16))
+        records.create_dataset("offsets", data = offsets)
+        records.create_dataset("winners", data = np.array(self.winners, dtype = np.int8))
+
+        records.create_dataset(
+            "visit_counts", data = np.concatenate(self.visit_counts).astype(np.uint32),
+            chunks = True, compression = "gzip"
+        )
+
+        h5file["game"].attrs["count"] = len(self.moves) - 1
+
+class GameRecordExperience():
+    """
+    Experience source over game record file. Blocks of games are replayed into board tensors,
+    optionally by pool of worker processes, and fed through shuffle buffer.
+    """
+
+    def __init__(self, path, games_per_block = 32, buffer_size = 16384, workers = 0):
+        self.buffer_size     = buffer_size
+        self.games_per_block = games_per_block
+        self.path            = path
+        self.workers         = workers
+
+        with h5py.File(path, "r") as h5:
+            self.board_size = int(h5["records"].attrs["board_size"])
+            self.game_count = int(h5["game"].attrs["count"])
+            self.offsets    = np.array(h5["records"]["offsets"])
+
+    def batches(self, batch_size, rng = None):
+        """
+        Yield shuffled (states, visit_counts, rewards, weights) mini-batches indefinitely.
+        """
+
+        return pipeline.buffered_batches(
+            read_record_block, self.blocks(), batch_size, max(self.buffer_size, batch_size), rng,
+            workers = self.workers
+        )
+
+    def blocks(self):
+        num_games = self.offsets.shape[0] - 1
+
+        return [
+            (self.path, start, min(start + self.games_per_block, num_games))
+            for start in range(0, num_games, self.games_per_block)
+        ]
+
+    def close(self):
+        """
+        Nothing to close: record file is opened only while block is read.
+        """
+
+    @property
+    def num_examples(self):
+        return int(self.offsets[-1])
+
+def encode_game(encoder, moves):
+    """
+    Replay move sequence from empty board and return encoded board tensor before each move.
+    """
+
+    game_state = GameState.new_game(encoder.board_size)
+    states     = np.zeros((len(moves),) + encoder.shape())
+
+    for i, move in enumerate(encoder.decode_moves(moves)):
+        states[i]  = encoder.encode_board(game_state)
+        game_state = game_state.play_move(move)
+
+    return states
+
+def export_records(record_path, h5file, workers = 0):
+    """
+    Replay all games in record file and write them as regular experience file of board tensors.
+    """
+
+    experience = GameRecordExperience(record_path, workers = workers)
+    blocks     = experience.blocks()
+    num_rows   = experience.num_examples
+
+    h5file.create_group("experience")
+    h5file.create_group("game")
+
+    h5file["game"].attrs["count"] = experience.game_count
+
+    encoder = Encoder(experience.board_size)
+    row     = 0
+
+    datasets = [
+        h5file["experience"].create_dataset("states",       (num_rows,) + encoder.shape()),
+        h5file["experience"].create_dataset("visit_counts", (num_rows, encoder.num_moves())),
+        h5file["experience"].create_dataset("rewards",      (num_rows,)),
+        h5file["experience"].create_dataset("weights",      (num_rows,))
+    ]
+
+    if workers:
+        executor     = ProcessPoolExecutor(workers)
+        block_arrays = pipeline.read_ahead(executor, read_record_block, blocks, 2 * workers)
+    else:
+        executor     = None
+        block_arrays = map(read_record_block, blocks)
+
+    try:
+        for arrays in block_arrays:
+            num_block_rows = arrays[0].shape[0]
+
+            for dataset, array in zip(datasets, arrays):
+                dataset[row:row + num_block_rows] = array
+
+            row += num_block_rows
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def load_records(h5file, encoder):
+    """
+    Load game records saved by GameRecorder.serialize() into new recorder, e.g. to add further
+    games to them.
+    """
+
+    records = h5file["records"]
+
+    if int(records.attrs["board_size"]) != encoder.board_size:
+        raise ValueError("Game records are for {0}x{0} board, not {1}x{1}".format(
+            int(records.attrs["board_size"]), encoder.board_size
+        ))
+
+    offsets      = np.array(records["offsets"])
+    moves        = np.array(records["moves"])
+    visit_counts = np.array(records["visit_counts"])
+    recorder     = GameRecorder(encoder)
+
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        recorder.moves.append(moves[start:stop])
+        recorder.visit_counts.append(visit_counts[start:stop])
+
+    recorder.winners = [int(winner) for winner in records["winners"]]
+
+    return recorder
+
+def read_record_block(block):
+    """
+    Replay games [start, stop) of record file into (states, visit_counts, rewards, weights)
+    arrays. Reward is 1 for positions where player to move went on to win and -1 otherwise; every
+    position has unit weight. Module-level so that it can run in worker process.
+    """
+
+    path, start, stop = block
+
+    with h5py.File(path, "r") as h5:
+        records = h5["records"]
+        offsets = records["offsets"][start:stop + 1]
+        first   = offsets[0]
+        last    = offsets[-1]
+
+        encoder      = Encoder(int(records.attrs["board_size"]))
+        moves        = records["moves"][first:last]
+        visit_counts = records["visit_counts"][first:last].astype(np.float64)
+        winners      = records["winners"][start:stop]
+
+    states  = []
+    rewards = []
+
+    for game, winner in enumerate(winners):
+        game_moves = moves[offsets[game] - first:offsets[game + 1] - first]
+
+        states.append(encode_game(encoder, game_moves))
+
+        # Black moves first, so black is to move at even positions.
+        to_move = np.where(np.arange(len(game_moves)) % 2 == 0, 1, -1)
+
+        rewards.append(to_move * winner)
+
+    return (
+        np.concatenate(states),
+        visit_counts,
+        np.concatenate(rewards),
+        np.ones(visit_counts.shape[0], dtype = np.float32)
+    )
@@ -9,14 +9,14 @@ import sys
 
 sys.path.append("../")
 
-from .                 import command
-from .                 import response
-from agent.termination import TerminationAgent
-from .board            import board_to_gtp
-from .board            import gtp_to_board
-from go_board_fast     import GameState
-from go_board_fast     import Move
-from utils.play_io     import print_board
+from .                  import command
+from .                  import response
+from agents.termination import TerminationAgent
+from .board             import board_to_gtp
+from .board             import gtp_to_board
+from go_board_fast      import GameState
+from go_board_fast      import Move
+from utils.play_io      import print_board
 
 
 HANDICAPS_9  = ["C3", "G7", "C7", "G3", "E5"]
@@ -39,19 +39,22 @@ class GTPInterface(object):
             "generate_move"    : self.handle_generate_move,
             "known_command"    : self.handle_known_command,
             "komi"             : self.ignore,
+            "list_commands"    : self.handle_list_commands,
+            "name"             : self.handle_name,
             "show_board"       : self.handle_show_board,
             "time_settings"    : self.ignore,
             "time_left"        : self.ignore,
             "play"             : self.handle_play,
             "protocol_version" : self.handle_protocol_version,
             "quit"             : self.handle_quit,
-            "unknown_command"  : self.handle_unknown_command
+            "unknown_command"  : self.handle_unknown_command,
+            "version"          : self.handle_version
         }
 
     def handle_board_size(self, size):
         if int(size) != 9 and int(size) != 13 and int(size) != 19:
             return response.error(
-                "Received request for unsupported board size ({0})".format(self.board_size)
+                "Received request for unsupported board size ({0})".format(size)
             )
 
         return response.success()
@@ -97,7 +100,13 @@ class GTPInterface(object):
         return response.success(board_to_gtp(move))
 
     def handle_known_command(self, command_name):
-        return response.bool_to_gtp(command_name in self.handler.keys())
+        return response.bool_to_gtp(command_name in self.handlers.keys())
+
+    def handle_list_commands(self):
+        return response.success("\n".join(sorted(self.handlers.keys())))
+
+    def handle_name(self):
+        return response.success("Eunkyo")
 
     def handle_play(self, color, move):
         if move.lower() == "pass":
@@ -134,19 +143,29 @@ class GTPInterface(object):
     def handle_unknown_command(self, *args):
         return response.error("Received unrecognized command")
 
+    def handle_version(self):
+        return response.success("1.0")
+
     def ignore(self, *args):
         return response.success()
 
     def process(self, command):
-        handler = self.handlers.get(command.name, self.handle_unknown)
+        handler = self.handlers.get(command.name, self.handle_unknown_command)
 
         return handler(*command.args)
 
     def run(self):
         while not self._stopped:
-            input_line = self._input.readline().strip()
-            cmd        = command.parse(input_line)
-            response   = self.process(cmd)
+            input_line = self._input.readline()
+
+            # Stop at end of input; skip empty lines as required by protocol.
+            if not input_line:
+                break
+            elif not input_line.strip():
+                continue
+
+            cmd        = command.parse(input_line.strip())
+            cmd_result = self.process(cmd)
 
-            self._output.write(response.serialize(cmd, response))
+            self._output.write(response.serialize(cmd, cmd_result))
             self._output.flush()
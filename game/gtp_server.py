@@ -4,21 +4,55 @@ This is the main script that runs the GTP game server.
 
 """
 
-from agents import termination
-from eunkyo import load_agent
-from gtp    import GTPInterface
-
+from agents            import termination
+from agents.background import BackgroundAgent
+from eunkyo            import load_agent
+from gtp               import GTPInterface
+from utils.runtime     import add_runtime_arguments
+from utils.runtime     import configure_runtime_from_args
+
+import argparse
 import h5py
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage = "python " + sys.argv[0] + " -a eunkyo --threads 4")
+
+    parser.add_argument(
+        "-a", "--agent", default = "eunkyo", type = str,
+        help = "agent filename prefix (default = eunkyo)"
+    )
+
+    parser.add_argument(
+        "--symmetries", default = 1, type = int,
+        help = "board orientations averaged per position evaluation, 1-8 (default = 1)"
+    )
 
+    add_runtime_arguments(parser)
+
+    return parser.parse_args()
 
 def main():
     print("\n========== Start Game ==========\n")
 
-    model             = h5py.File("./outputs/agent/eunkyo.h5", "r")
-    agent             = load_agent(model)
-    strategy          = termination.return_strategy("opponent_passes")
-    termination_agent = termination.TerminationAgent(agent, strategy)
-    game_server       = GTPInterface(termination_agent)
+    args       = parse_args()
+    agent_file = "./outputs/agent/" + args.agent + ".h5"
+
+    # Pin cores and size thread pools before TensorFlow is loaded.
+    configure_runtime_from_args(args)
+
+    with h5py.File(agent_file, "r") as h5:
+        board_size = int(h5["encoder"].attrs["board_size"])
+
+    # Model is loaded (and warmed up) on background thread, so administrative commands
+    # (protocol_version, name, board_size, ...) are answered at once and only first generated move
+    # waits for it.
+    agent       = BackgroundAgent(lambda: load_agent(
+        h5py.File(agent_file, "r"), symmetries = args.symmetries
+    ))
+    strategy    = termination.return_strategy("opponent_passes")
+    game_server = GTPInterface(agent, board_size, strategy)
 
     game_server.run()
 
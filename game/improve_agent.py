@@ -0,0 +1,435 @@
+"""
+
+This module runs generate-train-gate loop of agent improvement as one long-running job. Self-play
+workers play current best agent without pause and drop finished games into experience directory,
+trainer moves them into replay buffer and trains candidate after every batch of new games, and
+gate plays each candidate against best agent. Promoted candidates become next generation, which
+self-play workers pick up between chunks of games. All stages run at once in separate processes.
+
+"""
+
+from datetime         import datetime
+from encoder          import Encoder
+from eunkyo           import EunkyoAgent
+from eunkyo           import load_agent
+from evaluation_cache import EvaluationCache
+from experience       import combine_experience
+from go_board_fast    import Player
+from lockstep         import play_games
+from train_agent      import complete_episodes
+from train_agent      import experience_collectors
+from train_agent      import open_replay_buffer
+from utils.runtime    import add_runtime_arguments
+from utils.runtime    import configure_runtime_from_args
+from utils.runtime    import configure_worker_runtime
+
+import argparse
+import glob
+import h5py
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+
+
+# Disable TensorFlow warnings.
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+
+POLL_SECONDS = 5  # wait between checks for new self-play games
+
+def collect_experience(exp_dir, replay_buffer):
+    """
+    Move experience files written by self-play workers into replay buffer, oldest first, and
+    return number of games added.
+    """
+
+    num_games = 0
+
+    for exp_file in sorted(glob.glob(os.path.join(exp_dir, "*.h5")), key = os.path.getmtime):
+        with h5py.File(exp_file, "r") as h5:
+            num_games += int(h5["game"].attrs["count"]) + 1
+
+        replay_buffer.add(exp_file)
+
+        os.remove(exp_file)
+
+    return num_games
+
+def gate_worker(args, candidates, best):
+    """
+    Play each candidate against best agent and promote it to next generation if it wins at least
+    threshold of games. Candidates that queued up during match are skipped in favour of newest.
+    """
+
+    configure_worker_runtime(args, args.workers + 1, args.workers + 2)
+
+    generation = best.value
+    best_agent = load_player(args, generation_file(args.replay, generation))
+    finished   = False
+
+    while not finished:
+        candidate_file = candidates.get()
+
+        while not candidates.empty():
+            newer_file = candidates.get()
+
+            if newer_file is None:
+                finished = True
+            else:
+                candidate_file = newer_file
+
+        if candidate_file is None:
+            break
+
+        candidate  = load_player(args, candidate_file)
+        gate_start = datetime.now()  # match start time
+
+        wins = play_match(candidate, best_agent, args.board, args.gate_games, args.parallel)
+
+        print("[+] Gate: {0} won {1} / {2} against generation {3} ({4})".format(
+            os.path.basename(candidate_file), wins, args.gate_games, generation,
+            datetime.now() - gate_start
+        ))
+
+        if wins >= args.threshold * args.gate_games:
+            generation += 1
+            best_agent  = candidate
+
+            # Copy first, so that self-play workers never see generation without its file.
+            shutil.copyfile(candidate_file, generation_file(args.replay, generation))
+
+            best.value = generation
+
+            print("[+] Gate: promoted to generation {0}".format(generation))
+
+def generation_file(name, generation):
+    return "./outputs/agent/{0}_gen{1:03d}.h5".format(name, generation)
+
+def latest_generation(name):
+    """
+    Return highest generation saved by runs named name, or None if there is none.
+    """
+
+    pattern     = re.compile(re.escape(name) + r"_gen(\d+)\.h5$")
+    generations = [
+        int(match.group(1)) for match in map(pattern.match, os.listdir("./outputs/agent")) if match
+    ]
+
+    return max(generations, default = None)
+
+def load_player(args, agent_file):
+    """
+    Load agent for playing, with own evaluation cache if enabled. Models are not shared through
+    model cache, which would keep every candidate of long run in memory.
+    """
+
+    agent = load_agent(
+        h5py.File(agent_file, "r"), args.rounds, args.xla, args.symmetries, shared = False
+    )
+
+    if args.cache:
+        agent.set_cache(EvaluationCache(args.board, agent.encoder.num_planes, args.cache))
+
+    return agent
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage = "python " + sys.argv[0] + " -a agent -c 10 -r 50 --workers 4"
+    )
+
+    parser.add_argument(
+        "-a", "--agent", type = str,
+        help = "agent filename prefix of first generation of new run (default = new network)"
+    )
+
+    parser.add_argument(
+        "-b", "--board", default = 9, type = int, help = "Go ban size (default = 9)"
+    )
+
+    parser.add_argument(
+        "-c", "--candidates", default = 10, type = int,
+        help = "number of candidates trained before run stops (default = 10)"
+    )
+
+    parser.add_argument(
+        "-g", "--gens", type = int, help = "replay buffer size in generations (default = none)"
+    )
+
+    parser.add_argument(
+        "-k", "--chunk", default = 10, type = int,
+        help = "games self-play worker plays before saving them and checking for new agent "
+               "(default = 10)"
+    )
+
+    parser.add_argument(
+        "-n", "--network", default = "medium", type = str,
+        help = "network architecture of new agent: small, medium, large or residual tower "
+               "res<blocks>x<filters>, e.g. res6x64 (default = medium)"
+    )
+
+    parser.add_argument(
+        "-p", "--replay", default = "eunkyo", type = str,
+        help = "run name; names replay buffer, experience directory and agents (default = eunkyo)"
+    )
+
+    parser.add_argument(
+        "-r", "--rounds", default = 1, type = int,
+        help = "number of rounds per move selection (default = 1)"
+    )
+
+    parser.add_argument(
+        "-t", "--train-games", default = 50, type = int,
+        help = "number of new self-play games between candidates (default = 50)"
+    )
+
+    parser.add_argument(
+        "-w", "--window", default = 500000, type = int,
+        help = "replay buffer size in positions (default = 500000)"
+    )
+
+    parser.add_argument(
+        "--cache", default = 0, type = int,
+        help = "number of positions kept in symmetry-aware evaluation cache (default = 0, off)"
+    )
+
+    parser.add_argument(
+        "--channels-last", action = "store_true",
+        help = "build new agent with channels-last network layout (faster on CPU)"
+    )
+
+    parser.add_argument(
+        "--gate-games", default = 40, type = int,
+        help = "number of games candidate plays against best agent (default = 40)"
+    )
+
+    parser.add_argument(
+        "--parallel", default = 8, type = int,
+        help = "number of games played in lockstep per process (default = 8)"
+    )
+
+    parser.add_argument(
+        "--recency", default = 1.0, type = float,
+        help = "replay sampling weight decay per generation of age (default = 1)"
+    )
+
+    parser.add_argument(
+        "--symmetries", default = 1, type = int,
+        help = "board orientations averaged per position evaluation, 1-8 (default = 1)"
+    )
+
+    parser.add_argument(
+        "--threshold", default = 0.55, type = float,
+        help = "fraction of gate games candidate must win to be promoted (default = 0.55)"
+    )
+
+    parser.add_argument(
+        "--workers", default = 2, type = int, help = "number of self-play processes (default = 2)"
+    )
+
+    parser.add_argument(
+        "--xla", action = "store_true", help = "compile model inference with XLA"
+    )
+
+    add_runtime_arguments(parser)
+
+    return parser.parse_args()
+
+def play_match(agent, opponent, board_size, num_games, parallel):
+    """
+    Play num_games games in lockstep, agent taking black in first half and white in second half,
+    and return number of games agent won.
+    """
+
+    games_as = {
+        Player.black: (num_games + 1) // 2,
+        Player.white: num_games // 2
+    }
+
+    wins = 0
+
+    for color, color_games in games_as.items():
+        agents = {
+            color       : agent,
+            color.other : opponent
+        }
+
+        for entry in play_games(agents, board_size, color_games, parallel):
+            if entry.result.winner == color:
+                wins += 1
+
+    return wins
+
+def self_play_worker(args, worker_id, best):
+    """
+    Play chunks of self-play games with best agent and write each chunk to experience directory.
+    Best agent is reloaded whenever gate promotes new generation.
+    """
+
+    configure_worker_runtime(args, worker_id, args.workers + 2)
+
+    exp_dir    = "./outputs/exp/" + args.replay
+    generation = None
+
+    while True:
+        if best.value != generation:
+            generation = best.value
+            agent      = load_player(args, generation_file(args.replay, generation))
+
+            print("[+] Worker {0}: playing generation {1}".format(worker_id, generation))
+
+        agents = {
+            Player.black: agent,
+            Player.white: agent
+        }
+
+        collectors = []
+
+        for entry in play_games(agents, args.board, args.chunk, args.parallel,
+                                experience_collectors):
+            complete_episodes(entry.collectors, entry.result.winner)
+
+            collectors += entry.collectors.values()
+
+        exp_out = os.path.join(exp_dir, "worker{0}_{1}.h5".format(worker_id, uuid.uuid4().hex[:8]))
+
+        # Write under temporary name so that trainer never sees partial file.
+        with h5py.File(exp_out + ".part", "w") as h5:
+            combine_experience(args.chunk - 1, collectors).serialize(h5)
+
+        os.replace(exp_out + ".part", exp_out)
+
+def train_worker(args, candidates, generation):
+    """
+    Train candidate on replay buffer window whenever enough new games arrived and queue it for
+    gate. Training starts from given generation and continues from previous candidate, whether or
+    not it was promoted.
+    """
+
+    configure_worker_runtime(args, args.workers, args.workers + 2)
+
+    exp_dir       = "./outputs/exp/" + args.replay
+    agent         = load_agent(
+        h5py.File(generation_file(args.replay, generation), "r"), args.rounds, shared = False
+    )
+    replay_buffer = open_replay_buffer(args)
+
+    for candidate in range(1, args.candidates + 1):
+        new_games = collect_experience(exp_dir, replay_buffer)
+
+        while new_games < args.train_games:
+            time.sleep(POLL_SECONDS)
+
+            new_games += collect_experience(exp_dir, replay_buffer)
+
+        print("[+] Trainer: training candidate {0} on {1} position(s) in {2} generation(s)".format(
+            candidate, replay_buffer.num_examples, len(replay_buffer.generations)
+        ))
+
+        train_start    = datetime.now()  # training start time
+        candidate_file = agent.train(
+            replay_buffer, prefix = "{0}_cand{1:03d}".format(args.replay, candidate)
+        )
+
+        print("[+] Trainer: candidate {0} trained ({1})".format(
+            candidate, datetime.now() - train_start
+        ))
+
+        candidates.put(candidate_file)
+
+    replay_buffer.close()
+
+    candidates.put(None)
+
+def main():
+    print("\n========== Agent Improvement Module ==========\n")
+
+    # Configure command line argument parser.
+    args = parse_args()
+
+    # Pin cores; every stage is then pinned to its share of them and sizes thread pools to match.
+    configure_runtime_from_args(args)
+
+    for directory in ("./outputs/agent", "./outputs/exp/" + args.replay):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    generation = latest_generation(args.replay)
+
+    # Run of same name continues from its best generation; otherwise first generation is given
+    # agent or new network.
+    if generation is not None:
+        print("[+] Continuing from generation {0}\n".format(generation))
+
+        if args.agent:
+            print("[-] Ignoring agent {0}: run {1} already has generations\n".format(
+                args.agent, args.replay
+            ))
+    elif args.agent:
+        generation = 0
+
+        shutil.copyfile("./outputs/agent/" + args.agent + ".h5", generation_file(args.replay, 0))
+    else:
+        generation = 0
+
+        from networks.config import build_network
+
+        data_format  = "channels_last" if args.channels_last else "channels_first"
+        game_encoder = Encoder(args.board, data_format)
+        agent        = EunkyoAgent(build_network(args.network, game_encoder), game_encoder)
+
+        with h5py.File(generation_file(args.replay, 0), "w") as h5:
+            agent.serialize(h5)
+
+    # TensorFlow does not survive fork, so every stage starts in fresh interpreter.
+    context    = multiprocessing.get_context("spawn")
+    best       = context.Value("i", generation)  # generation of best agent
+    candidates = context.Queue()
+
+    workers = [
+        context.Process(target = self_play_worker, args = (args, i, best), daemon = True)
+        for i in range(args.workers)
+    ]
+
+    trainer = context.Process(target = train_worker, args = (args, candidates, generation))
+    gate    = context.Process(target = gate_worker,  args = (args, candidates, best))
+
+    print("[+] Running {0} self-play worker(s), trainer and gate ...\n".format(args.workers))
+
+    run_start = datetime.now()  # running start time
+
+    for process in workers + [trainer, gate]:
+        process.start()
+
+    # Trainer would wait forever for games once all self-play workers failed.
+    while trainer.is_alive() and any(worker.is_alive() for worker in workers):
+        trainer.join(POLL_SECONDS)
+
+    if trainer.is_alive():
+        for process in (trainer, gate):
+            process.terminate()
+            process.join()
+
+        raise RuntimeError("All self-play workers stopped; see their errors above")
+
+    # Gate would wait forever for candidates of failed trainer.
+    if trainer.exitcode:
+        candidates.put(None)
+
+    gate.join()
+
+    # Games in progress are dropped; finished chunks are picked up by next run.
+    for worker in workers:
+        worker.terminate()
+        worker.join()
+
+    print("\n[+] Best agent: generation {0} ({1})".format(
+        best.value, generation_file(args.replay, best.value)
+    ))
+    print("[+] Running time: {0}".format(datetime.now() - run_start))
+
+if __name__ == "__main__":
+    main()
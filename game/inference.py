@@ -0,0 +1,569 @@
+"""
+
+This module implements model inference backends. Calling Keras model directly dispatches every
+layer from Python on each call, which dominates cost of small tree search batches, so forward pass
+is traced once into TensorFlow graph with fixed input signature and reused for every call.
+
+Trained networks can also be exported, with batch normalization folded into preceding layers, and
+evaluated by pure NumPy engine. Self-play workers and GTP server running exported networks do not
+import TensorFlow at all. Same folded network is rebuilt as inference-only Keras model, which agent
+files store next to trainable model. Folded model can further be quantized to int8, calibrated on
+sample of self-play positions, and run with TensorFlow Lite interpreter.
+
+"""
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+import numpy as np
+
+import json
+
+
+ACTIVATIONS = {
+    "linear"  : lambda x: x,
+    "relu"    : lambda x: np.maximum(x, 0),
+    "sigmoid" : lambda x: 1 / (1 + np.exp(-x)),
+    "tanh"    : np.tanh
+}
+
+class CompiledModel():
+    """
+    Callable returning (priors, values) as NumPy arrays for batch of encoded board tensors. Graph
+    takes float32 batch of any size with model input shape, so it is traced only once. With xla
+    set, graph is also compiled with XLA.
+    """
+
+    def __init__(self, model, xla = False):
+        # Import TensorFlow here, not at top, so that importing agents stays fast.
+        import tensorflow as tf
+
+        self.model = model
+        self.xla   = xla
+
+        input_spec = tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32)
+
+        @tf.function(input_signature = [input_spec], jit_compile = xla)
+        def forward(model_input):
+            return model(model_input, training = False)
+
+        self._forward = forward
+
+    def __call__(self, model_input):
+        outputs = self._forward(np.asarray(model_input, dtype = np.float32))
+
+        return tuple(output.numpy() for output in outputs)
+
+class NumpyNetwork():
+    """
+    Evaluate exported network with NumPy. Layers are dictionaries holding layer type, names of
+    input layers, configuration and weights, listed in topological order. Convolutions are
+    computed as im2col windows contracted with kernel, in data format of original layer.
+    """
+
+    def __init__(self, layers, inputs, outputs):
+        self.inputs  = inputs
+        self.layers  = layers
+        self.outputs = outputs
+
+    def __call__(self, model_input):
+        values = {self.inputs[0]: np.asarray(model_input, dtype = np.float32)}
+
+        for layer in self.layers:
+            if layer["type"] != "InputLayer":
+                layer_inputs = [values[name] for name in layer["inputs"]]
+
+                values[layer["name"]] = LAYER_OPS[layer["type"]](layer, *layer_inputs)
+
+        return tuple(values[name] for name in self.outputs)
+
+class QuantizedModel():
+    """
+    Run int8 TensorFlow Lite model. Input is quantized and outputs dequantized inside model, so
+    callable takes and returns float32 arrays like other backends. Standalone tflite_runtime
+    interpreter is used when installed, which avoids importing TensorFlow.
+    """
+
+    def __init__(self, model_content, output_names, num_threads = None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+        if num_threads is None:
+            from utils.runtime import runtime_config
+
+            num_threads = runtime_config["threads"] or None
+
+        self.output_names = output_names
+
+        self._interpreter = Interpreter(model_content = model_content, num_threads = num_threads)
+        self._runner      = self._interpreter.get_signature_runner()
+        self._input_name  = list(self._runner.get_input_details().keys())[0]
+
+    def __call__(self, model_input):
+        # Signature runner resizes input tensor whenever batch size changes.
+        outputs = self._runner(**{self._input_name: np.asarray(model_input, dtype = np.float32)})
+
+        return tuple(outputs[name] for name in self.output_names)
+
+def activation(name):
+    if name == "softmax":
+        return softmax
+
+    if name not in ACTIVATIONS:
+        raise ValueError("Unsupported activation: {0}".format(name))
+
+    return ACTIVATIONS[name]
+
+def batch_normalization(layer, x):
+    shape = [1] * x.ndim
+
+    shape[layer["config"]["axis"]] = -1
+
+    return x * layer["weights"]["scale"].reshape(shape) + layer["weights"]["offset"].reshape(shape)
+
+def build_inference_model(model):
+    """
+    Build Keras model computing same outputs as model with batch normalization folded, dropout
+    removed and activations fused. Returned model is for inference only.
+    """
+
+    from tensorflow.keras.layers import Activation
+    from tensorflow.keras.layers import Add
+    from tensorflow.keras.layers import BatchNormalization
+    from tensorflow.keras.layers import Conv2D
+    from tensorflow.keras.layers import Dense
+    from tensorflow.keras.layers import Flatten
+    from tensorflow.keras.layers import Input
+    from tensorflow.keras.layers import MaxPooling2D
+    from tensorflow.keras.layers import MaxPooling3D
+    from tensorflow.keras.layers import Reshape
+    from tensorflow.keras.models import Model
+
+    network = fold_layers(model)
+    tensors = {}
+
+    for layer in network.layers:
+        config  = layer["config"]
+        name    = layer["name"]
+        weights = layer["weights"]
+
+        if layer["type"] == "InputLayer":
+            tensors[name] = Input(shape = model.input_shape[1:], name = name)
+
+            continue
+
+        if layer["type"] == "Activation":
+            keras_layer = Activation(config["activation"], name = name)
+        elif layer["type"] == "Add":
+            keras_layer = Add(name = name)
+            weights     = []
+        elif layer["type"] == "BatchNormalization":
+            # Unfolded normalization keeps precomputed scale and offset as gamma and beta, with
+            # moving statistics set so that normalization step is identity.
+            keras_layer = BatchNormalization(axis = config["axis"], epsilon = 1e-3, name = name)
+            weights     = [
+                weights["scale"], weights["offset"],
+                np.zeros_like(weights["scale"]), np.full_like(weights["scale"], 1 - 1e-3)
+            ]
+        elif layer["type"] == "Conv2D":
+            keras_layer = Conv2D(
+                weights["kernel"].shape[-1], weights["kernel"].shape[:2],
+                activation  = config["activation"],
+                data_format = config["data_format"],
+                name        = name,
+                padding     = config["padding"],
+                strides     = config["strides"]
+            )
+            weights     = [weights["kernel"], weights["bias"]]
+        elif layer["type"] == "Dense":
+            keras_layer = Dense(
+                weights["kernel"].shape[-1], activation = config["activation"], name = name
+            )
+            weights     = [weights["kernel"], weights["bias"]]
+        elif layer["type"] == "Flatten":
+            keras_layer = Flatten(data_format = config["data_format"], name = name)
+            weights     = []
+        elif layer["type"] in ("MaxPooling2D", "MaxPooling3D"):
+            pooling     = MaxPooling2D if layer["type"] == "MaxPooling2D" else MaxPooling3D
+            keras_layer = pooling(
+                config["pool_size"],
+                data_format = config["data_format"],
+                name        = name,
+                padding     = config["padding"],
+                strides     = config["strides"]
+            )
+            weights     = []
+        elif layer["type"] == "Reshape":
+            keras_layer = Reshape(config["target_shape"], name = name)
+            weights     = []
+
+        layer_inputs = [tensors[input_name] for input_name in layer["inputs"]]
+
+        # Merge layers take list of inputs.
+        tensors[name] = keras_layer(layer_inputs if len(layer_inputs) > 1 else layer_inputs[0])
+
+        if weights:
+            keras_layer.set_weights(weights)
+
+    return Model(
+        inputs  = [tensors[name] for name in network.inputs],
+        outputs = [tensors[name] for name in network.outputs]
+    )
+
+def conv2d(layer, x):
+    config = layer["config"]
+    kernel = layer["weights"]["kernel"]
+
+    if config["data_format"] == "channels_first":
+        spatial_axes  = (2, 3)
+        contract_axes = ([1, 4, 5], [2, 0, 1])
+    else:
+        spatial_axes  = (1, 2)
+        contract_axes = ([3, 4, 5], [2, 0, 1])
+
+    windows = sliding_windows(x, kernel.shape[:2], config["strides"], config["padding"],
+                              spatial_axes, 0)
+
+    # Contract channel and kernel window axes; output has channels last.
+    y = np.tensordot(windows, kernel, axes = contract_axes) + layer["weights"]["bias"]
+    y = activation(config["activation"])(y)
+
+    if config["data_format"] == "channels_first":
+        y = y.transpose(0, 3, 1, 2)
+
+    return y
+
+def convert_layer(layer_type, name, inputs, config, weights):
+    """
+    Translate Keras layer configuration and weights into engine layer.
+    """
+
+    weights = [np.asarray(weight, dtype = np.float32) for weight in weights]
+    layer   = {"name": name, "type": layer_type, "inputs": inputs, "config": {}, "weights": {}}
+
+    if layer_type == "Activation":
+        layer["config"]["activation"] = config["activation"]
+    elif layer_type == "BatchNormalization":
+        axis = config["axis"]
+
+        if isinstance(axis, (list, tuple)):
+            if len(axis) != 1:
+                raise ValueError("Normalization over several axes not supported: {0}".format(name))
+
+            axis = axis[0]
+
+        gamma = weights.pop(0) if config["scale"] else 1.0
+        beta  = weights.pop(0) if config["center"] else 0.0
+
+        mean, variance = weights
+        scale          = gamma / np.sqrt(variance + config["epsilon"])
+
+        layer["config"]["axis"] = int(axis)
+
+        layer["weights"]["scale"]  = np.asarray(scale, dtype = np.float32)
+        layer["weights"]["offset"] = np.asarray(beta - mean * scale, dtype = np.float32)
+    elif layer_type == "Conv2D":
+        if tuple(config["dilation_rate"]) != (1, 1) or config.get("groups", 1) != 1:
+            raise ValueError("Dilated or grouped convolution not supported: {0}".format(name))
+
+        layer["config"]["activation"]  = config["activation"]
+        layer["config"]["data_format"] = config["data_format"]
+        layer["config"]["padding"]     = config["padding"]
+        layer["config"]["strides"]     = list(config["strides"])
+
+        layer["weights"]["kernel"] = weights[0]
+        layer["weights"]["bias"]   = weights[1] if config["use_bias"] else \
+                                     np.zeros(weights[0].shape[-1], dtype = np.float32)
+    elif layer_type == "Dense":
+        layer["config"]["activation"] = config["activation"]
+
+        layer["weights"]["kernel"] = weights[0]
+        layer["weights"]["bias"]   = weights[1] if config["use_bias"] else \
+                                     np.zeros(weights[0].shape[-1], dtype = np.float32)
+    elif layer_type == "Flatten":
+        layer["config"]["data_format"] = config.get("data_format") or "channels_last"
+    elif layer_type in ("MaxPooling2D", "MaxPooling3D"):
+        layer["config"]["data_format"] = config["data_format"]
+        layer["config"]["padding"]     = config["padding"]
+        layer["config"]["pool_size"]   = list(config["pool_size"])
+        layer["config"]["strides"]     = list(config["strides"] or config["pool_size"])
+    elif layer_type == "Reshape":
+        layer["config"]["target_shape"] = list(config["target_shape"])
+    elif layer_type not in ("Add", "Dropout", "InputLayer"):
+        raise ValueError("Unsupported layer type: {0} ({1})".format(layer_type, name))
+
+    # Fail at export rather than at first evaluation.
+    if "activation" in layer["config"]:
+        activation(layer["config"]["activation"])
+
+    return layer
+
+def dense(layer, x):
+    y = np.dot(x, layer["weights"]["kernel"]) + layer["weights"]["bias"]
+
+    return activation(layer["config"]["activation"])(y)
+
+def export_network(model, h5group):
+    """
+    Fold Keras model and write layers to HDF5 group: layer list as JSON attribute and weights as
+    one subgroup per layer.
+    """
+
+    network = fold_layers(model)
+
+    h5group.attrs["inputs"]  = json.dumps(network.inputs)
+    h5group.attrs["outputs"] = json.dumps(network.outputs)
+    h5group.attrs["layers"]  = json.dumps([
+        {key: layer[key] for key in ("name", "type", "inputs", "config")}
+        for layer in network.layers
+    ])
+
+    for layer in network.layers:
+        layer_group = h5group.create_group(layer["name"])
+
+        for name, value in layer["weights"].items():
+            layer_group.create_dataset(name, data = value)
+
+def export_quantized(model, calibration_states, h5group):
+    """
+    Quantize folded model to int8 and write TensorFlow Lite model to HDF5 group. Activation ranges
+    are calibrated on calibration_states, which should be sample of positions agent will evaluate.
+    """
+
+    import tensorflow as tf
+
+    inference_model = build_inference_model(model)
+
+    def representative_dataset():
+        for state in calibration_states:
+            yield [np.asarray(state[np.newaxis], dtype = np.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(inference_model)
+
+    converter.optimizations             = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset    = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    model_content = converter.convert()
+
+    h5group.attrs["outputs"] = json.dumps(list(inference_model.output_names))
+
+    h5group.create_dataset("tflite", data = np.frombuffer(model_content, dtype = np.uint8))
+
+def flatten(layer, x):
+    # Keras flattens channels-first tensors in channels-last order.
+    if layer["config"]["data_format"] == "channels_first" and x.ndim > 2:
+        x = np.moveaxis(x, 1, -1)
+
+    return x.reshape(x.shape[0], -1)
+
+def fold_batch_normalization(layer, producer):
+    """
+    Fold normalization into convolution or dense layer that feeds only it. Return whether folded.
+    """
+
+    if layer["type"] != "BatchNormalization" or producer is None:
+        return False
+
+    if producer["type"] not in ("Conv2D", "Dense") or producer["config"]["activation"] != "linear":
+        return False
+
+    if producer["type"] == "Dense":
+        channel_axes = (1, -1)
+    elif producer["config"]["data_format"] == "channels_first":
+        channel_axes = (1,)
+    else:
+        channel_axes = (3, -1)
+
+    if layer["config"]["axis"] not in channel_axes:
+        return False
+
+    scale  = layer["weights"]["scale"]
+    offset = layer["weights"]["offset"]
+
+    # Output channels are last axis of both convolution and dense kernels.
+    producer["weights"]["kernel"] = producer["weights"]["kernel"] * scale
+    producer["weights"]["bias"]   = producer["weights"]["bias"] * scale + offset
+
+    return True
+
+def fold_layers(model):
+    """
+    Convert Keras functional model into NumpyNetwork. Dropout layers are removed, batch
+    normalization following convolution or dense layer is folded into its weights and activation
+    layers are fused into preceding layer where possible. Only graph structure, configuration and
+    weights of model are used, so TensorFlow is not imported here.
+    """
+
+    layers = []
+
+    for keras_layer in model.layers:
+        if len(keras_layer._inbound_nodes) > 1:
+            raise ValueError("Shared layer not supported: {0}".format(keras_layer.name))
+
+        layers.append(convert_layer(
+            type(keras_layer).__name__, keras_layer.name, layer_inputs(keras_layer),
+            keras_layer.get_config(), keras_layer.get_weights()
+        ))
+
+    inputs  = producers(model.inputs)
+    outputs = producers(model.outputs)
+
+    layers, outputs = remove_layers(layers, outputs, lambda layer, _: layer["type"] == "Dropout")
+    layers, outputs = remove_layers(layers, outputs, fold_batch_normalization)
+    layers, outputs = remove_layers(layers, outputs, fuse_activation)
+
+    return NumpyNetwork(layers, inputs, outputs)
+
+def fuse_activation(layer, producer):
+    if layer["type"] != "Activation" or producer is None:
+        return False
+
+    if producer["type"] not in ("Conv2D", "Dense") or producer["config"]["activation"] != "linear":
+        return False
+
+    producer["config"]["activation"] = layer["config"]["activation"]
+
+    return True
+
+def layer_inputs(layer):
+    """
+    Names of layers whose outputs feed layer (see producers()).
+    """
+
+    if type(layer).__name__ == "InputLayer":
+        return []
+
+    return producers(layer.input)
+
+def load_network(h5group):
+    inputs  = json.loads(h5group.attrs["inputs"])
+    layers  = json.loads(h5group.attrs["layers"])
+    outputs = json.loads(h5group.attrs["outputs"])
+
+    for layer in layers:
+        layer["weights"] = {
+            name: np.array(dataset, dtype = np.float32)
+            for name, dataset in h5group[layer["name"]].items()
+        }
+
+    return NumpyNetwork(layers, inputs, outputs)
+
+def load_quantized(h5group, num_threads = None):
+    return QuantizedModel(
+        np.array(h5group["tflite"]).tobytes(), json.loads(h5group.attrs["outputs"]), num_threads
+    )
+
+def max_pooling(layer, x):
+    """
+    Max pooling over two (MaxPooling2D) or three (MaxPooling3D) spatial axes.
+    """
+
+    config       = layer["config"]
+    num_axes     = len(config["pool_size"])
+    first_axis   = 2 if config["data_format"] == "channels_first" else 1
+    spatial_axes = tuple(range(first_axis, first_axis + num_axes))
+
+    windows = sliding_windows(x, config["pool_size"], config["strides"], config["padding"],
+                              spatial_axes, -np.inf)
+
+    return windows.max(axis = tuple(range(-num_axes, 0)))
+
+def producers(tensors):
+    """
+    Names of layers that produced Keras tensor or list of tensors. Layer graph is followed through
+    live tensors rather than serialized model configuration, whose inbound node format differs
+    between Keras 2 and Keras 3.
+    """
+
+    if not isinstance(tensors, (list, tuple)):
+        tensors = [tensors]
+
+    # History holds producing layer (Keras 2) or operation (Keras 3) first.
+    return [tensor._keras_history[0].name for tensor in tensors]
+
+def remove_layers(layers, outputs, rule):
+    """
+    Drop every single-input layer for which rule(layer, producer) holds and rewire its consumers to
+    its input. Producer is input layer if dropped layer is its only consumer, otherwise None. Rule
+    may update producer in place.
+    """
+
+    consumers = {}
+
+    for layer in layers:
+        for name in layer["inputs"]:
+            consumers[name] = consumers.get(name, 0) + 1
+
+    for name in outputs:
+        consumers[name] = consumers.get(name, 0) + 1
+
+    by_name = {layer["name"]: layer for layer in layers}
+    renamed = {}
+    kept    = []
+
+    for layer in layers:
+        layer["inputs"] = [renamed.get(name, name) for name in layer["inputs"]]
+
+        producer = None
+
+        if len(layer["inputs"]) == 1 and consumers[layer["inputs"][0]] == 1:
+            producer = by_name[layer["inputs"][0]]
+
+        if len(layer["inputs"]) == 1 and rule(layer, producer):
+            renamed[layer["name"]] = layer["inputs"][0]
+
+            # Layers feeding dropped layer now feed its consumers.
+            consumers[layer["inputs"][0]] += consumers.get(layer["name"], 0) - 1
+        else:
+            kept.append(layer)
+
+    return kept, [renamed.get(name, name) for name in outputs]
+
+def reshape(layer, x):
+    return x.reshape((x.shape[0],) + tuple(layer["config"]["target_shape"]))
+
+def sliding_windows(x, window, strides, padding, spatial_axes, pad_value):
+    """
+    Return view of x with (window height, window width) axes appended, one window per output
+    position. Padding follows TensorFlow "same" convention (extra padding after).
+    """
+
+    if padding == "same":
+        pad_width = [(0, 0)] * x.ndim
+
+        for axis, size, stride in zip(spatial_axes, window, strides):
+            length          = x.shape[axis]
+            total           = max((-(-length // stride) - 1) * stride + size - length, 0)
+            pad_width[axis] = (total // 2, total - total // 2)
+
+        x = np.pad(x, pad_width, constant_values = pad_value)
+
+    windows = sliding_window_view(x, tuple(window), axis = spatial_axes)
+    strided = [slice(None)] * windows.ndim
+
+    for axis, stride in zip(spatial_axes, strides):
+        strided[axis] = slice(None, None, stride)
+
+    return windows[tuple(strided)]
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis = -1, keepdims = True))
+
+    return e / np.sum(e, axis = -1, keepdims = True)
+
+LAYER_OPS = {
+    "Activation"         : lambda layer, x: activation(layer["config"]["activation"])(x),
+    "Add"                : lambda layer, *inputs: sum(inputs[1:], inputs[0]),
+    "BatchNormalization" : batch_normalization,
+    "Conv2D"             : conv2d,
+    "Dense"              : dense,
+    "Dropout"            : lambda layer, x: x,
+    "Flatten"            : flatten,
+    "MaxPooling2D"       : max_pooling,
+    "MaxPooling3D"       : max_pooling,
+    "Reshape"            : reshape
+}
@@ -0,0 +1,132 @@
+"""
+
+This module plays many games in lockstep within one process. Every game keeps own board and tree
+search; searches pause at each position they need evaluated (see EunkyoAgent.search()), pending
+positions of all games are evaluated in one batched model call per agent, and searches resume with
+their results. Inference is thus batched without threads or processes.
+
+"""
+
+from go_board_fast import GameState
+from utils.score   import compute_result
+
+import numpy as np
+
+
+class LockstepGame():
+    """
+    Game in progress: current state, search of player to move and position search waits on.
+    Collectors map each player to collector recording its decisions (or are None).
+    """
+
+    def __init__(self, index, board_size, collectors = None):
+        self.collectors = collectors
+        self.game       = GameState.new_game(board_size)
+        self.index      = index
+        self.num_moves  = 0
+        self.planes     = None
+        self.result     = None
+        self.search     = None
+
+def advance(entry, agents, evaluation = None):
+    """
+    Resume search of game with evaluation and run it until it waits on position that is not cached.
+    Moves selected by finished searches are played and searches of next player started. Return
+    False once game is over.
+    """
+
+    while True:
+        agent = agents[entry.game.next_player]
+
+        try:
+            if entry.search is None:
+                collectors   = entry.collectors or {}
+                entry.search = agent.search(entry.game, collectors.get(entry.game.next_player))
+                planes       = next(entry.search)
+            else:
+                planes = entry.search.send(evaluation)
+        except StopIteration as stop:
+            entry.game       = entry.game.play_move(stop.value)
+            entry.num_moves += 1
+            entry.search     = None
+            evaluation       = None
+
+            if entry.game.is_over():
+                return False
+
+            continue
+
+        evaluation = agent.cache.lookup(planes) if agent.cache is not None else None
+
+        if evaluation is None:
+            entry.planes = planes
+
+            return True
+
+def evaluate_waiting(entries, agents):
+    """
+    Evaluate positions games wait on with one model call per distinct agent and return (game,
+    evaluation) pairs. Evaluations are added to agent cache, if any.
+    """
+
+    by_agent = {}
+
+    for entry in entries:
+        agent = agents[entry.game.next_player]
+
+        by_agent.setdefault(id(agent), (agent, []))[1].append(entry)
+
+    evaluated = []
+
+    for agent, agent_entries in by_agent.values():
+        priors, values = agent.evaluate_batch(np.stack([entry.planes for entry in agent_entries]))
+
+        for entry, entry_priors, value in zip(agent_entries, priors, values.tolist()):
+            if agent.cache is not None:
+                agent.cache.store(entry.planes, entry_priors, value)
+
+            evaluated.append((entry, (entry_priors, value)))
+
+    return evaluated
+
+def play_games(agents, board_size, num_games, parallel = 16, new_collectors = None,
+               first_game = 0):
+    """
+    Play games numbered first_game to num_games - 1, up to parallel at once, and yield each
+    LockstepGame (with result set) as it finishes. Agents map each player to EunkyoAgent; same
+    agent object for both players (as in self-play) evaluates positions of both in one call. If
+    given, new_collectors() returns collectors of new game.
+    """
+
+    indices = iter(range(first_game, num_games))
+    ready   = []  # (game, evaluation) pairs to resume
+
+    def start_game():
+        index = next(indices, None)
+
+        if index is not None:
+            collectors = new_collectors() if new_collectors is not None else None
+
+            ready.append((LockstepGame(index, board_size, collectors), None))
+
+    for _ in range(parallel):
+        start_game()
+
+    while ready:
+        waiting = []
+
+        # Finished games are replaced at once, so that batch stays full.
+        while ready:
+            entry, evaluation = ready.pop()
+
+            if advance(entry, agents, evaluation):
+                waiting.append(entry)
+            else:
+                entry.result = compute_result(entry.game)
+
+                yield entry
+
+                start_game()
+
+        if waiting:
+            ready = evaluate_waiting(waiting, agents)
@@ -0,0 +1,255 @@
+"""
+
+This module merges experience files and shard sets into one experience file or new shard set. Data
+is streamed chunk by chunk, so memory use does not depend on size of inputs. Repeated positions are
+found by external sort: digests of board tensors are sorted in runs written to temporary files and
+merged, so deduplication needs disk space, not memory, in proportion to number of positions.
+
+"""
+
+from datetime   import datetime
+from experience import ExperienceWriter
+from experience import read_rows
+from shards     import ShardedExperience
+from shards     import ShardWriter
+from shards     import is_shard_set
+
+import numpy as np
+
+import argparse
+import h5py
+import hashlib
+import heapq
+import os
+import sys
+import tempfile
+
+
+DIGEST_DTYPE = np.dtype([("high", "<u8"), ("low", "<u8"), ("row", "<i8")])
+
+def copy_rows(files, writer, chunk_size = 4096, keep = None):
+    """
+    Copy rows of every input file into writer chunk by chunk, skipping rows not marked in keep (if
+    given) by their index across all files. Games of each file are credited with its final chunk.
+    Return number of rows read.
+    """
+
+    num_read = 0
+
+    for path, num_games in files:
+        with h5py.File(path, "r") as h5:
+            experience = h5["experience"]
+            num_rows   = experience["states"].shape[0]
+
+            if num_rows == 0:
+                writer.write_rows(*read_rows(experience, 0, 0), num_games = num_games)
+
+            for start in range(0, num_rows, chunk_size):
+                stop = min(start + chunk_size, num_rows)
+                rows = read_rows(experience, start, stop)
+
+                if keep is not None:
+                    rows = [field[keep[num_read:num_read + stop - start]] for field in rows]
+
+                writer.write_rows(*rows, num_games = num_games if stop == num_rows else 0)
+
+                num_read += stop - start
+
+    return num_read
+
+def first_occurrences(files, work_dir, chunk_size = 4096, run_size = 1 << 20):
+    """
+    Return boolean array, memory-mapped in work_dir, marking first row of every distinct board
+    tensor, with rows numbered across all files. Digests of run_size rows at a time are sorted and
+    written to work_dir, and sorted runs are merged; row index breaks ties, so first row of each
+    digest in merged order is its first occurrence.
+    """
+
+    runs     = []
+    pending  = []
+    num_rows = 0
+
+    def write_run():
+        digests = np.concatenate(pending)
+        digests = digests[np.lexsort((digests["row"], digests["low"], digests["high"]))]
+        run     = os.path.join(work_dir, "run_%05d.npy" % len(runs))
+
+        np.save(run, digests)
+
+        runs.append(run)
+        pending.clear()
+
+    for path, _ in files:
+        with h5py.File(path, "r") as h5:
+            states = h5["experience"]["states"]
+
+            for start in range(0, states.shape[0], chunk_size):
+                stop = min(start + chunk_size, states.shape[0])
+
+                pending.append(state_digests(states[start:stop], num_rows))
+
+                num_rows += stop - start
+
+                if sum(len(digests) for digests in pending) >= run_size:
+                    write_run()
+
+    if num_rows == 0:
+        return np.zeros(0, dtype = bool)
+
+    if pending:
+        write_run()
+
+    keep = np.lib.format.open_memmap(
+        os.path.join(work_dir, "keep.npy"), mode = "w+", dtype = bool, shape = (num_rows,)
+    )
+
+    previous = None
+
+    for high, low, row in heapq.merge(*[read_run(run, chunk_size) for run in runs]):
+        if (high, low) != previous:
+            keep[row] = True
+            previous  = (high, low)
+
+    return keep
+
+def input_files(exp_in):
+    """
+    Expand experience prefixes into list of (path, number of games) pairs. Shard sets contribute
+    one entry per shard.
+    """
+
+    files = []
+
+    for exp in exp_in:
+        path = "./outputs/exp/" + exp
+
+        if is_shard_set(path):
+            shard_set = ShardedExperience(path)
+
+            files += [
+                (os.path.join(path, shard["file"]), shard["num_games"])
+                for shard in shard_set.shards
+            ]
+        else:
+            with h5py.File(path + ".h5", "r") as h5:
+                files.append((path + ".h5", int(h5["game"].attrs["count"]) + 1))
+
+    return files
+
+def merge_experience(files, writer, chunk_size = 4096, dedup = False):
+    """
+    Copy rows of every input file into writer chunk by chunk. With dedup set, positions whose
+    board tensor occurred before are dropped (first occurrence is kept); temporary files are
+    written next to outputs. Return number of rows read.
+    """
+
+    if not dedup:
+        return copy_rows(files, writer, chunk_size)
+
+    with tempfile.TemporaryDirectory(dir = "./outputs/exp") as work_dir:
+        keep = first_occurrences(files, work_dir, chunk_size)
+
+        try:
+            return copy_rows(files, writer, chunk_size, keep)
+        finally:
+            # Memory map must be closed before its file is removed.
+            del keep
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage = "python " + sys.argv[0] + " -i exp1 exp2 -o merged")
+
+    parser.add_argument(
+        "-c", "--chunk", default = 4096, type = int,
+        help = "number of rows copied per chunk (default = 4096)"
+    )
+
+    parser.add_argument(
+        "-d", "--dedup", action = "store_true", help = "drop repeated board positions"
+    )
+
+    parser.add_argument(
+        "-i", "--input", nargs = "+", required = True, type = str,
+        help = "experience input filename prefixes or shard set names"
+    )
+
+    parser.add_argument(
+        "-o", "--output", required = True, type = str, help = "experience output filename prefix"
+    )
+
+    parser.add_argument(
+        "-x", "--shards", action = "store_true", help = "write output as shard set"
+    )
+
+    parser.add_argument(
+        "-z", "--compress", action = "store_true", help = "compress output with gzip"
+    )
+
+    return parser.parse_args()
+
+def read_run(run, block_size):
+    """
+    Yield (high, low, row) digests of sorted run, reading block_size digests at a time.
+    """
+
+    digests = np.load(run, mmap_mode = "r")
+
+    for start in range(0, len(digests), block_size):
+        yield from digests[start:start + block_size].tolist()
+
+def state_digests(states, first_row):
+    """
+    Return 128-bit digests of board tensors as (high, low, row) records, numbering rows from
+    first_row.
+    """
+
+    hashes  = b"".join(hashlib.blake2b(state.tobytes(), digest_size = 16).digest()
+                       for state in states)
+    digests = np.empty(len(states), dtype = DIGEST_DTYPE)
+    halves  = np.frombuffer(hashes, dtype = "<u8").reshape((-1, 2))
+
+    digests["high"] = halves[:, 0]
+    digests["low"]  = halves[:, 1]
+    digests["row"]  = np.arange(first_row, first_row + len(states))
+
+    return digests
+
+def main():
+    print("\n========== Experience Merge Module ==========\n")
+
+    args = parse_args()
+
+    compression = "gzip" if args.compress else None
+    files       = input_files(args.input)
+
+    if not os.path.exists("./outputs/exp"):
+        os.makedirs("./outputs/exp")
+
+    print("[+] Merging {0} experience file(s) ...\n".format(len(files)))
+
+    merge_start = datetime.now()  # merge start time
+
+    if args.shards:
+        with h5py.File(files[0][0], "r") as h5:
+            board_size = h5["experience"]["states"].shape[-1]
+
+        writer = ShardWriter(
+            "./outputs/exp/" + args.output, board_size, compression = compression
+        )
+
+        num_read = merge_experience(files, writer, args.chunk, args.dedup)
+
+        writer.close()
+    else:
+        with h5py.File("./outputs/exp/" + args.output + ".h5", "w") as h5:
+            writer = ExperienceWriter(h5, compression = compression)
+
+            num_read = merge_experience(files, writer, args.chunk, args.dedup)
+
+            writer.close()
+
+    print("[+] Positions: {0} read, {1} written".format(num_read, writer.num_rows))
+    print("[+] Games: {0}".format(writer.num_games))
+    print("\n[+] Merge time: {0}".format(datetime.now() - merge_start))
+
+if __name__ == "__main__":
+    main()
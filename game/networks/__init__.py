@@ -1,3 +1,4 @@
-from .nn_small  import *
-from .nn_medium import *
-from .nn_large  import *
+from .nn_small    import *
+from .nn_medium   import *
+from .nn_large    import *
+from .nn_residual import *
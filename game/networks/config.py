@@ -0,0 +1,56 @@
+"""
+
+This module builds networks by architecture name: "small", "medium" and "large" fixed networks, or
+residual tower "res<blocks>x<filters>" with optional head sizes appended as "p<policy filters>",
+"v<value filters>" and "h<value hidden nodes>", e.g. "res6x64" or "res10x128p4v2h128".
+
+"""
+
+import importlib
+import re
+
+
+FIXED_NETWORKS = ("small", "medium", "large")
+
+RESIDUAL_PATTERN = re.compile(r"res(\d+)x(\d+)(?:p(\d+))?(?:v(\d+))?(?:h(\d+))?$")
+
+def build_network(name, encoder):
+    """
+    Build network named name for board tensors and moves of encoder, in encoder data format.
+    """
+
+    if name in FIXED_NETWORKS:
+        nn     = importlib.import_module("networks.nn_" + name)
+        config = {}
+    else:
+        nn     = importlib.import_module("networks.nn_residual")
+        config = residual_config(name)
+
+    return nn.build_model(
+        encoder.shape(), encoder.num_moves(), data_format = encoder.data_format, **config
+    )
+
+def residual_config(name):
+    """
+    Parse residual tower name into build_model() keyword arguments.
+    """
+
+    match = RESIDUAL_PATTERN.match(name)
+
+    if match is None:
+        raise ValueError("Unknown network architecture: {0}".format(name))
+
+    blocks, filters, policy_filters, value_filters, value_nodes = match.groups()
+
+    config = {"blocks": int(blocks), "filters": int(filters)}
+
+    if policy_filters:
+        config["policy_filters"] = int(policy_filters)
+
+    if value_filters:
+        config["value_filters"] = int(value_filters)
+
+    if value_nodes:
+        config["num_nodes_value"] = int(value_nodes)
+
+    return config
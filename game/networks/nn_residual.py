@@ -0,0 +1,69 @@
+"""
+
+This module implements a residual convolutional neural network for reinforcement learning. Unlike
+fixed networks, tower depth, width and head sizes are parameters, and board resolution is kept
+through all blocks, so any board size is supported.
+
+"""
+
+from tensorflow.keras.layers import Activation
+from tensorflow.keras.layers import Add
+from tensorflow.keras.layers import BatchNormalization
+from tensorflow.keras.layers import Conv2D
+from tensorflow.keras.layers import Dense
+from tensorflow.keras.layers import Flatten
+from tensorflow.keras.layers import Input
+from tensorflow.keras.models import Model
+
+
+def build_model(input_shape, num_nodes_policy, num_nodes_value = 256,
+                data_format = "channels_first", blocks = 6, filters = 64, policy_filters = 2,
+                value_filters = 1):
+    channel_axis = 1 if data_format == "channels_first" else -1
+
+    nn_input = Input(shape = input_shape)
+
+    # Build input convolution.
+    nn_hidden = Conv2D(filters, (3, 3), data_format = data_format, padding = "same")(nn_input)
+    nn_hidden = BatchNormalization(axis = channel_axis)(nn_hidden)
+    nn_hidden = Activation("relu")(nn_hidden)
+
+    # Build residual tower.
+    for _ in range(blocks):
+        nn_hidden = residual_block(nn_hidden, filters, data_format)
+
+    # Build policy hidden and output layers to return probability distribution over moves.
+    nn_policy = Conv2D(policy_filters, (1, 1), data_format = data_format)(nn_hidden)
+    nn_policy = BatchNormalization(axis = channel_axis)(nn_policy)
+    nn_policy = Activation("relu")(nn_policy)
+    nn_policy = Flatten()(nn_policy)
+    nn_policy = Dense(num_nodes_policy, activation = "softmax")(nn_policy)
+
+    # Build value hidden and output layers to indicate which player is winning.
+    nn_value = Conv2D(value_filters, (1, 1), data_format = data_format)(nn_hidden)
+    nn_value = BatchNormalization(axis = channel_axis)(nn_value)
+    nn_value = Activation("relu")(nn_value)
+    nn_value = Flatten()(nn_value)
+    nn_value = Dense(num_nodes_value, activation = "relu")(nn_value)
+    nn_value = Dense(1, activation = "tanh")(nn_value)
+
+    model = Model(inputs = [nn_input], outputs = [nn_policy, nn_value])
+
+    return model
+
+def residual_block(nn_input, filters, data_format = "channels_first"):
+    """
+    Two 3x3 convolutions with batch normalization, added to block input before final activation.
+    """
+
+    channel_axis = 1 if data_format == "channels_first" else -1
+
+    nn_hidden = Conv2D(filters, (3, 3), data_format = data_format, padding = "same")(nn_input)
+    nn_hidden = BatchNormalization(axis = channel_axis)(nn_hidden)
+    nn_hidden = Activation("relu")(nn_hidden)
+
+    nn_hidden = Conv2D(filters, (3, 3), data_format = data_format, padding = "same")(nn_hidden)
+    nn_hidden = BatchNormalization(axis = channel_axis)(nn_hidden)
+    nn_hidden = Add()([nn_hidden, nn_input])
+
+    return Activation("relu")(nn_hidden)
@@ -0,0 +1,27 @@
+"""
+
+This module implements max pooling shared by network layouts.
+
+"""
+
+from tensorflow.keras.layers import MaxPooling2D
+from tensorflow.keras.layers import MaxPooling3D
+from tensorflow.keras.layers import Reshape
+
+
+def max_pooling(nn_hidden, data_format = "channels_first"):
+    """
+    Channels-first networks apply MaxPooling2D((2, 2)) with its default channels-last format, so
+    pooling halves channel and row axes. Channels-last networks pool same two axes, which keeps
+    their weights interchangeable with channels-first networks.
+    """
+
+    if data_format == "channels_first":
+        return MaxPooling2D((2, 2))(nn_hidden)
+
+    rows, cols, channels = nn_hidden.shape[1:]
+
+    nn_hidden = Reshape((rows, cols, channels, 1))(nn_hidden)
+    nn_hidden = MaxPooling3D((2, 1, 2))(nn_hidden)
+
+    return Reshape((rows // 2, cols, channels // 2))(nn_hidden)
@@ -0,0 +1,246 @@
+"""
+
+This module implements the training input pipeline, which turns game experience into mini-batches
+of model inputs and training targets.
+
+"""
+
+from collections        import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.symmetry     import random_symmetries
+from utils.symmetry     import transform_batch
+
+import numpy as np
+
+import multiprocessing
+import queue
+import threading
+
+
+def action_targets(visit_counts):
+    """
+    Normalize number of visits made for each move in tree search into probability distribution.
+    """
+
+    visit_sums = np.sum(visit_counts, axis = 1, keepdims = True)
+
+    return visit_counts / np.maximum(visit_sums, 1)
+
+def array_batches(arrays, batch_size, rng = None):
+    """
+    Yield shuffled mini-batches (one slice per array) from in-memory arrays with same number of
+    rows. Examples are reshuffled after each pass so that generator can feed any number of epochs.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    num_examples = arrays[0].shape[0]
+
+    while True:
+        order = rng.permutation(num_examples)
+
+        for start in range(0, num_examples, batch_size):
+            index = order[start:start + batch_size]
+
+            yield tuple(array[index] for array in arrays)
+
+def buffered_batches(read_block, blocks, batch_size, buffer_size, rng = None, workers = 0):
+    """
+    Yield shuffled mini-batches from experience too large for memory. Blocks are contiguous row
+    ranges read with read_block(block); block order is shuffled on each pass, and rows are mixed
+    in shuffle buffer holding at least buffer_size rows before batches are drawn from it.
+
+    With workers > 0, blocks are read ahead by that many worker processes; read_block must then be
+    module-level function and blocks must be picklable.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # Batches are usually drawn on prefetch thread of process running TensorFlow, which must not
+    # be forked, so workers start from fresh interpreters.
+    if workers:
+        executor = ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context("spawn"))
+    else:
+        executor = None
+
+    try:
+        while True:
+            order = [blocks[i] for i in rng.permutation(len(blocks))]
+
+            if executor is None:
+                block_arrays = map(read_block, order)
+            else:
+                block_arrays = read_ahead(executor, read_block, order, 2 * workers)
+
+            yield from shuffle_buffer(block_arrays, batch_size, buffer_size, rng)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait = False, cancel_futures = True)
+
+def distillation_targets(teacher, layout = None, temperature = 1.0, mix = 0.0):
+    """
+    Return target function for training_batches() which replaces search targets with outputs of
+    teacher predictor. Teacher policy is softened by temperature (above 1 spreads probability over
+    more moves) and blended with search targets by mix (0 = teacher only). Layout converts
+    channels-first states into teacher network layout.
+    """
+
+    def targets(states, action_target, rewards):
+        if layout is not None:
+            states = layout(states)
+
+        priors, values = teacher(states)
+
+        priors = np.asarray(priors, dtype = np.float64) ** (1.0 / temperature)
+        priors = priors / np.maximum(np.sum(priors, axis = 1, keepdims = True), 1e-12)
+        values = np.reshape(values, np.shape(rewards))
+
+        action_target = (1.0 - mix) * priors + mix * action_target
+        value_target  = (1.0 - mix) * values + mix * rewards
+
+        return action_target.astype(np.float32), value_target.astype(np.float32)
+
+    return targets
+
+def read_ahead(executor, read_block, blocks, depth):
+    """
+    Yield read_block(block) for each block in order, keeping up to depth reads in flight.
+    """
+
+    in_flight = deque()
+
+    for block in blocks:
+        in_flight.append(executor.submit(read_block, block))
+
+        if len(in_flight) >= depth:
+            yield in_flight.popleft().result()
+
+    while in_flight:
+        yield in_flight.popleft().result()
+
+def shuffle_buffer(block_arrays, batch_size, buffer_size, rng):
+    """
+    Mix rows of consecutive blocks in buffer of at least buffer_size rows and yield one pass of
+    shuffled mini-batches.
+    """
+
+    pending  = []
+    num_rows = 0
+
+    for arrays in block_arrays:
+        pending.append(arrays)
+        num_rows += arrays[0].shape[0]
+
+        if num_rows < buffer_size:
+            continue
+
+        # Draw all full batches from shuffled buffer and carry remainder over.
+        buffer = shuffle_rows(pending, rng)
+        cut    = (num_rows // batch_size) * batch_size
+
+        for start in range(0, cut, batch_size):
+            yield tuple(array[start:start + batch_size] for array in buffer)
+
+        pending  = [tuple(array[cut:] for array in buffer)]
+        num_rows = num_rows - cut
+
+    # Flush what is left at end of pass.
+    if num_rows:
+        buffer = shuffle_rows(pending, rng)
+
+        for start in range(0, num_rows, batch_size):
+            yield tuple(array[start:start + batch_size] for array in buffer)
+
+def prefetch(batches, depth = 4):
+    """
+    Run batch generator on background thread, keeping up to depth batches ready so that disk I/O
+    and target computation overlap with training steps. Closing returned generator stops thread
+    and closes batch generator.
+    """
+
+    ready   = queue.Queue(maxsize = depth)
+    stopped = threading.Event()
+    done    = object()
+
+    def deliver(item):
+        # Wait for free slot, giving up once consumer has stopped.
+        while not stopped.is_set():
+            try:
+                ready.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not deliver(batch):
+                    return
+        except Exception as error:
+            deliver(error)
+        else:
+            deliver(done)
+        finally:
+            if hasattr(batches, "close"):
+                batches.close()
+
+    worker = threading.Thread(target = produce, daemon = True)
+
+    worker.start()
+
+    try:
+        while True:
+            batch = ready.get()
+
+            if batch is done:
+                return
+
+            if isinstance(batch, Exception):
+                raise batch
+
+            yield batch
+    finally:
+        stopped.set()
+
+def shuffle_rows(parts, rng):
+    """
+    Concatenate list of array tuples field by field and apply one shared random row order.
+    """
+
+    fields = [np.concatenate(field) for field in zip(*parts)]
+    order  = rng.permutation(fields[0].shape[0])
+
+    return [field[order] for field in fields]
+
+def training_batches(batches, augment = True, rng = None, layout = None, targets = None):
+    """
+    Convert raw (states, visit_counts, rewards, weights) batches into (model_input,
+    [action_target, value_target], [weights, weights]) batches as expected by model.fit(). If
+    augment is set, each example is transformed by one of eight board symmetries drawn at random,
+    with matching permutation of its action target. Experience states are channels-first planes;
+    layout, if given, converts them into network layout (see Encoder.model_layout()). Targets, if
+    given, computes training targets from transformed states instead of search results (see
+    distillation_targets()).
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    for states, visit_counts, rewards, weights in batches:
+        action_target = action_targets(visit_counts)
+
+        if augment:
+            symmetries            = random_symmetries(states.shape[0], rng)
+            states, action_target = transform_batch(states, action_target, symmetries)
+
+        if targets is not None:
+            action_target, rewards = targets(states, action_target, rewards)
+
+        if layout is not None:
+            states = layout(states)
+
+        yield states, [action_target, rewards], [weights, weights]
@@ -0,0 +1,145 @@
+"""
+
+This module quantizes trained agents to int8 for fast CPU inference. Activation ranges are
+calibrated on positions sampled from experience file, and agreement of quantized and float model
+is reported on further positions from same file.
+
+"""
+
+from datetime  import datetime
+from eunkyo    import load_agent
+from inference import export_quantized
+from inference import load_quantized
+
+import numpy as np
+
+import argparse
+import h5py
+import os
+import sys
+import time
+
+
+# Disable TensorFlow warnings.
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+
+def evaluations_per_second(predictor, states, num_calls = 200):
+    predictor(states[:1])
+
+    start = time.perf_counter()
+
+    for i in range(num_calls):
+        predictor(states[i % len(states)][np.newaxis])
+
+    return num_calls / (time.perf_counter() - start)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage = "python " + sys.argv[0] + " -a agent -e exp -o quantized"
+    )
+
+    parser.add_argument(
+        "-a", "--agent", required = True, type = str, help = "agent filename prefix"
+    )
+
+    parser.add_argument(
+        "-c", "--calib", default = 256, type = int,
+        help = "number of positions used for calibration (default = 256)"
+    )
+
+    parser.add_argument(
+        "-e", "--exp", required = True, type = str, help = "experience filename prefix"
+    )
+
+    parser.add_argument(
+        "-o", "--output", required = True, type = str, help = "quantized agent filename prefix"
+    )
+
+    parser.add_argument(
+        "-t", "--test", default = 1024, type = int,
+        help = "number of positions used for agreement report (default = 1024)"
+    )
+
+    return parser.parse_args()
+
+def report_agreement(float_predictor, quantized_predictor, states, batch_size = 256):
+    """
+    Print how closely quantized model follows float model on states.
+    """
+
+    float_outputs     = []
+    quantized_outputs = []
+
+    for start in range(0, len(states), batch_size):
+        float_outputs.append(float_predictor(states[start:start + batch_size]))
+        quantized_outputs.append(quantized_predictor(states[start:start + batch_size]))
+
+    priors_f, values_f = [np.concatenate(field) for field in zip(*float_outputs)]
+    priors_q, values_q = [np.concatenate(field) for field in zip(*quantized_outputs)]
+
+    top_move   = np.mean(np.argmax(priors_f, axis = 1) == np.argmax(priors_q, axis = 1))
+    distance   = np.mean(0.5 * np.sum(np.abs(priors_f - priors_q), axis = 1))
+    value_sign = np.mean(np.sign(values_f) == np.sign(values_q))
+    value_diff = np.mean(np.abs(values_f - values_q))
+
+    print("[+] Positions compared: {0}".format(len(states)))
+    print("[+] Policy top move agreement: {0:.2%}".format(top_move))
+    print("[+] Policy total variation distance: {0:.4f}".format(distance))
+    print("[+] Value sign agreement: {0:.2%}".format(value_sign))
+    print("[+] Value mean absolute difference: {0:.4f}".format(value_diff))
+
+    print("\n[+] Evaluations per second (batch of 1): {0:.0f} float, {1:.0f} int8".format(
+        evaluations_per_second(float_predictor, states),
+        evaluations_per_second(quantized_predictor, states)
+    ))
+
+def sample_states(exp_path, num_states, rng):
+    with h5py.File(exp_path, "r") as h5:
+        dataset = h5["experience"]["states"]
+        rows    = rng.choice(dataset.shape[0], min(num_states, dataset.shape[0]), replace = False)
+
+        # HDF5 fancy indexing needs increasing indices; shuffle afterwards.
+        states = np.asarray(dataset[np.sort(rows)], dtype = np.float32)
+
+    return states[rng.permutation(len(states))]
+
+def main():
+    print("\n========== Agent Quantization Module ==========\n")
+
+    args = parse_args()
+    rng  = np.random.default_rng()
+
+    agent  = load_agent(h5py.File("./outputs/agent/" + args.agent + ".h5", "r"))
+    states = sample_states("./outputs/exp/" + args.exp + ".h5", args.calib + args.test, rng)
+    states = agent.encoder.model_layout(states)
+
+    if agent.model is None:
+        raise ValueError("Agent {0} has no trainable model to quantize".format(args.agent))
+
+    # Keep calibration and test positions apart when experience file is large enough.
+    num_calib    = min(args.calib, len(states))
+    calib_states = states[:num_calib]
+    test_states  = states[num_calib:] if len(states) > num_calib else states
+
+    print("[+] Quantizing agent on {0} position(s) ...\n".format(num_calib))
+
+    quantize_start = datetime.now()  # quantization start time
+
+    with h5py.File("./outputs/agent/" + args.output + ".h5", "w") as h5:
+        h5.create_group("encoder")
+        h5.create_group("quantized")
+
+        h5["encoder"].attrs["board_size"]  = agent.encoder.board_size
+        h5["encoder"].attrs["data_format"] = agent.encoder.data_format
+
+        export_quantized(agent.model, calib_states, h5["quantized"])
+
+        quantized_predictor = load_quantized(h5["quantized"])
+
+    print("[+] Quantization time: {0}\n".format(datetime.now() - quantize_start))
+
+    report_agreement(agent.predictor, quantized_predictor, test_states)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+
+This module implements the replay buffer, a sliding window over the most recent generations of
+self-play experience. Training cost per generation stays constant because only positions inside
+the window are sampled, and experience that falls out of the window is deleted from disk.
+
+"""
+
+import numpy as np
+
+import h5py
+import json
+import os
+import shutil
+
+
+INDEX_FILE = "index.json"
+
+class ReplayBuffer():
+    """
+    Each generation is one experience file copied into buffer directory. Index records, for every
+    generation still in window, its file, number of positions and games, and first position that
+    remains in window (older rows of oldest generation are trimmed once window is full).
+    """
+
+    def __init__(self, directory, max_positions = None, max_generations = None, recency = 1.0):
+        self.directory       = directory
+        self.max_generations = max_generations
+        self.max_positions   = max_positions
+        self.recency         = recency  # sampling weight decay per generation of age (1 = uniform)
+
+        self._h5files = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        index_path = os.path.join(directory, INDEX_FILE)
+
+        if os.path.exists(index_path):
+            with open(index_path, "r") as index_file:
+                index = json.load(index_file)
+
+            self.generations     = index["generations"]
+            self.next_generation = index["next_generation"]
+        else:
+            self.generations     = []
+            self.next_generation = 0
+
+    def add(self, exp_path):
+        """
+        Copy experience file into buffer as newest generation and evict positions that fall out
+        of window.
+        """
+
+        file_name = "gen_%05d.h5" % self.next_generation
+
+        shutil.copyfile(exp_path, os.path.join(self.directory, file_name))
+
+        with h5py.File(os.path.join(self.directory, file_name), "r") as h5:
+            num_rows   = int(h5["experience"]["states"].shape[0])
+            game_count = int(h5["game"].attrs["count"]) + 1
+
+        self.generations.append({
+            "generation" : self.next_generation,
+            "file"       : file_name,
+            "num_rows"   : num_rows,
+            "num_games"  : game_count,
+            "start"      : 0
+        })
+
+        self.next_generation += 1
+
+        self.evict()
+        self.save_index()
+
+    def batches(self, batch_size, rng = None):
+        """
+        Yield (states, visit_counts, rewards, weights) mini-batches sampled with replacement from
+        window. Generations are picked in proportion to positions in window times recency ** age,
+        so recency of 1 samples all positions uniformly.
+        """
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        sizes = np.array([gen["num_rows"] - gen["start"] for gen in self.generations])
+        ages  = np.arange(len(self.generations))[::-1]
+        probs = sizes * (float(self.recency) ** ages)
+
+        if np.sum(probs) <= 0:
+            raise ValueError("Replay buffer {0} has no positions to sample".format(self.directory))
+
+        probs = probs / np.sum(probs)
+
+        while True:
+            picks  = rng.choice(len(self.generations), size = batch_size, p = probs)
+            parts  = []
+
+            for i in np.unique(picks):
+                gen  = self.generations[i]
+                rows = rng.integers(gen["start"], gen["num_rows"], size = np.sum(picks == i))
+
+                # HDF5 fancy indexing needs increasing unique indices, so read each row once and
+                # expand duplicates afterwards.
+                unique_rows, inverse = np.unique(rows, return_inverse = True)
+                experience           = self._open(gen["file"])["experience"]
+
+                if "weights" in experience:
+                    weights = experience["weights"][unique_rows][inverse]
+                else:
+                    weights = np.ones(rows.shape[0], dtype = np.float32)
+
+                parts.append(tuple(
+                    experience[name][unique_rows][inverse]
+                    for name in ("states", "visit_counts", "rewards")
+                ) + (weights,))
+
+            yield tuple(np.concatenate(field) for field in zip(*parts))
+
+    def close(self):
+        for h5 in self._h5files.values():
+            h5.close()
+
+        self._h5files = {}
+
+    def evict(self):
+        """
+        Drop generations beyond generation limit, then trim oldest positions beyond position
+        limit. Files of generations that leave window entirely are deleted.
+        """
+
+        if self.max_generations is not None:
+            while len(self.generations) > self.max_generations:
+                self._remove(self.generations[0])
+
+        if self.max_positions is not None:
+            excess = self.num_examples - self.max_positions
+
+            while excess > 0:
+                oldest    = self.generations[0]
+                remaining = oldest["num_rows"] - oldest["start"]
+
+                if remaining <= excess:
+                    self._remove(oldest)
+
+                    excess -= remaining
+                else:
+                    oldest["start"] += excess
+
+                    excess = 0
+
+    @property
+    def game_count(self):
+        # Follow experience file convention of storing index of last game.
+        return sum(gen["num_games"] for gen in self.generations) - 1
+
+    @property
+    def num_examples(self):
+        return sum(gen["num_rows"] - gen["start"] for gen in self.generations)
+
+    def save_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump({
+                "generations"     : self.generations,
+                "next_generation" : self.next_generation
+            }, index_file, indent = 2)
+
+        os.replace(index_path + ".tmp", index_path)
+
+    def _open(self, file_name):
+        if file_name not in self._h5files:
+            self._h5files[file_name] = h5py.File(os.path.join(self.directory, file_name), "r")
+
+        return self._h5files[file_name]
+
+    def _remove(self, gen):
+        self.generations.remove(gen)
+
+        if gen["file"] in self._h5files:
+            self._h5files.pop(gen["file"]).close()
+
+        os.remove(os.path.join(self.directory, gen["file"]))
@@ -0,0 +1,266 @@
+"""
+
+This module implements the sharded experience layout. A shard set is a directory of fixed-size
+experience files plus small JSON index files recording, for each shard, its number of positions,
+range of games and board size. Each writer process owns its own index file, so any number of
+self-play processes can write into the same shard set; only blocks of game indices are allocated
+from shared counter file, so that game ranges of different writers never overlap.
+
+"""
+
+from experience import ExperienceBuffer
+from experience import read_rows
+
+import numpy as np
+
+import glob
+import h5py
+import json
+import os
+import pipeline
+import uuid
+
+
+COUNTER_FILE = "next_game"
+
+class ShardWriter():
+    """
+    Buffer self-play games and write them out as shards of shard_size positions. Games may span
+    two shards; each shard counts games that end inside it. Shards are gzip-compressed when
+    compression is set.
+    """
+
+    def __init__(self, directory, board_size, shard_size = 8192, writer_id = None,
+                 compression = None):
+        self.board_size  = int(board_size)
+        self.compression = compression
+        self.directory   = directory
+        self.shard_size  = shard_size
+        self.writer_id   = writer_id if writer_id is not None else uuid.uuid4().hex[:8]
+
+        self._carry_games = 0
+        self._pending     = []
+        self._num_pending = 0
+        self._shards      = []
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def claim_games(self, num_games):
+        """
+        Allocate block of num_games consecutive game indices of shard set and return first one.
+        Counter file is updated under exclusive lock, so blocks of concurrent writers never
+        overlap. Shard sets written before counter existed continue after last game of their
+        shards.
+        """
+
+        # Imported here since file locking is only available on Unix.
+        import fcntl
+
+        with open(os.path.join(self.directory, COUNTER_FILE), "a+") as counter:
+            fcntl.flock(counter, fcntl.LOCK_EX)
+
+            counter.seek(0)
+
+            text = counter.read().strip()
+
+            if text:
+                game_index = int(text)
+            elif is_shard_set(self.directory):
+                game_index = max(
+                    shard["last_game"] for shard in ShardedExperience(self.directory).shards
+                ) + 1
+            else:
+                game_index = 0
+
+            counter.seek(0)
+            counter.truncate()
+            counter.write(str(game_index + num_games))
+
+            return game_index
+
+    def close(self):
+        """
+        Write remaining positions as final (smaller) shard.
+        """
+
+        if self._num_pending:
+            self._write_shard(self._num_pending)
+
+        # Games completed by empty writes after last shard still count towards it.
+        if self._carry_games and self._shards:
+            self._shards[-1]["num_games"] += self._carry_games
+            self._carry_games              = 0
+
+            self._write_index()
+
+    @property
+    def num_games(self):
+        return sum(shard["num_games"] for shard in self._shards) + self._carry_games
+
+    @property
+    def num_rows(self):
+        return sum(shard["num_rows"] for shard in self._shards) + self._num_pending
+
+    def write_game(self, states, visit_counts, rewards, game_index, weights = None):
+        self.write_rows(
+            states, visit_counts, rewards, weights, num_games = 1, game_index = game_index
+        )
+
+    def write_rows(self, states, visit_counts, rewards, weights = None, num_games = 0,
+                   game_index = -1):
+        """
+        Append positions that complete num_games games (counted at last row), all attributed to
+        game_index. Used directly when copying experience whose game boundaries are unknown.
+        """
+
+        num_rows = len(states)
+
+        if weights is None:
+            weights = np.ones(num_rows, dtype = np.float32)
+
+        if num_rows == 0:
+            self._carry_games += num_games
+
+            return
+
+        game_ends     = np.zeros(num_rows, dtype = np.int64)
+        game_ends[-1] = num_games + self._carry_games
+
+        self._carry_games = 0
+
+        self._pending.append((
+            np.asarray(states),
+            np.asarray(visit_counts),
+            np.asarray(rewards),
+            np.asarray(weights),
+            np.full(num_rows, game_index, dtype = np.int64),
+            game_ends
+        ))
+
+        self._num_pending += num_rows
+
+        while self._num_pending >= self.shard_size:
+            self._write_shard(self.shard_size)
+
+    def _write_shard(self, num_rows):
+        fields = [np.concatenate(field) for field in zip(*self._pending)]
+
+        states, visit_counts, rewards, weights, games, game_ends = [
+            field[:num_rows] for field in fields
+        ]
+
+        file_name = "shard_%s_%05d.h5" % (self.writer_id, len(self._shards))
+        shard     = {
+            "file"       : file_name,
+            "num_rows"   : int(num_rows),
+            "num_games"  : int(np.sum(game_ends)),
+            "first_game" : int(games[0]),
+            "last_game"  : int(games[-1])
+        }
+
+        # Write under temporary name so readers never see partial shard.
+        shard_path = os.path.join(self.directory, file_name)
+
+        with h5py.File(shard_path + ".tmp", "w") as h5:
+            shard_exp = ExperienceBuffer(
+                shard["num_games"] - 1, states, visit_counts, rewards, weights
+            )
+
+            shard_exp.serialize(h5, self.compression)
+
+            h5["game"].attrs["board_size"] = self.board_size
+            h5["game"].attrs["first_game"] = shard["first_game"]
+            h5["game"].attrs["last_game"]  = shard["last_game"]
+
+        os.replace(shard_path + ".tmp", shard_path)
+
+        self._shards.append(shard)
+        self._write_index()
+
+        remainder         = [field[num_rows:] for field in fields]
+        self._pending     = [tuple(remainder)] if remainder[0].shape[0] else []
+        self._num_pending = remainder[0].shape[0]
+
+    def _write_index(self):
+        index_path = os.path.join(self.directory, "index_%s.json" % self.writer_id)
+
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(
+                {"board_size": self.board_size, "shards": self._shards}, index_file, indent = 2
+            )
+
+        os.replace(index_path + ".tmp", index_path)
+
+class ShardedExperience():
+    """
+    Read shard set through its index files. Shards are read as whole blocks by pool of worker
+    processes (when workers > 0) and mixed in shuffle buffer, so that decompression and disk reads
+    of several shards proceed in parallel with training.
+    """
+
+    def __init__(self, directory, buffer_size = 16384, workers = 0):
+        self.buffer_size = buffer_size
+        self.directory   = directory
+        self.workers     = workers
+
+        self.board_size = None
+        self.shards     = []
+
+        for index_path in sorted(glob.glob(os.path.join(directory, "index_*.json"))):
+            with open(index_path, "r") as index_file:
+                index = json.load(index_file)
+
+            if self.board_size is None:
+                self.board_size = index["board_size"]
+            elif self.board_size != index["board_size"]:
+                raise ValueError("Shard set mixes board sizes: {0} and {1}".format(
+                    self.board_size, index["board_size"]
+                ))
+
+            self.shards += index["shards"]
+
+        if not self.shards:
+            raise FileNotFoundError("No experience shards found in {0}".format(directory))
+
+    def batches(self, batch_size, rng = None):
+        """
+        Yield shuffled (states, visit_counts, rewards, weights) mini-batches indefinitely.
+        """
+
+        blocks = [
+            (os.path.join(self.directory, shard["file"]), 0, shard["num_rows"])
+            for shard in self.shards
+        ]
+
+        return pipeline.buffered_batches(
+            read_experience_block, blocks, batch_size, max(self.buffer_size, batch_size), rng,
+            workers = self.workers
+        )
+
+    def close(self):
+        """
+        Nothing to close: shard files are opened only while block is read.
+        """
+
+    @property
+    def game_count(self):
+        # Follow experience file convention of storing index of last game.
+        return sum(shard["num_games"] for shard in self.shards) - 1
+
+    @property
+    def num_examples(self):
+        return sum(shard["num_rows"] for shard in self.shards)
+
+def is_shard_set(path):
+    return os.path.isdir(path) and bool(glob.glob(os.path.join(path, "index_*.json")))
+
+def read_experience_block(block):
+    """
+    Read rows [start, stop) of experience file. Module-level so that it can run in worker process.
+    """
+
+    path, start, stop = block
+
+    with h5py.File(path, "r") as h5:
+        return read_rows(h5["experience"], start, stop)
@@ -4,19 +4,35 @@ This module implements Go agent training using game simulation.
 
 """
 
-from datetime      import datetime
-from encoder       import Encoder
-from eunkyo        import EunkyoAgent
-from eunkyo        import load_agent
-from experience    import ExperienceCollector
-from experience    import combine_experience
-from experience    import load_experience
-from go_board_fast import GameState
-from go_board_fast import Player
-from utils.play_io import print_board
-
-import networks.nn_medium as nn
-import utils.score        as score
+from datetime         import datetime
+from encoder          import Encoder
+from eunkyo           import EunkyoAgent
+from eunkyo           import load_agent
+from evaluation_cache import EvaluationCache
+from experience       import ExperienceCollector
+from experience       import ExperienceStream
+from experience       import ExperienceWriter
+from experience       import aggregate_positions
+from experience       import combine_experience
+from experience       import load_experience
+from game_record      import GameRecordExperience
+from game_record      import GameRecorder
+from game_record      import load_records
+from go_board_fast    import GameState
+from go_board_fast    import Player
+from lockstep         import play_games
+from pipeline         import distillation_targets
+from replay           import ReplayBuffer
+from shards           import ShardedExperience
+from shards           import ShardWriter
+from shards           import is_shard_set
+from utils.play_io    import print_board
+from utils.runtime    import add_runtime_arguments
+from utils.runtime    import configure_runtime_from_args
+
+import utils.score as score
+
+import numpy as np
 
 import argparse
 import h5py
@@ -28,6 +44,53 @@ import sys
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 
+def append_experience(writer, collectors, num_games):
+    """
+    Append experience of collectors, recorded since last call, to writer and commit it, so that
+    writer holds num_games games in all.
+    """
+
+    if collectors:
+        exp = combine_experience(num_games - 1, collectors)
+
+        writer.write_rows(
+            exp.states, exp.visit_counts, exp.rewards, exp.weights, num_games - writer.num_games,
+            keys = exp.keys
+        )
+
+    writer.close()
+
+def load_checkpoint(exp_out, run):
+    """
+    Return writer appending to experience saved by interrupted run at exp_out, or None if run
+    completed or never started. Run maps names identifying run (agent and continued experience) to
+    values; checkpoint of run with other values is refused, since its games would be mixed with
+    games of this run.
+    """
+
+    if not os.path.exists(exp_out):
+        return None
+
+    h5 = h5py.File(exp_out, "a")
+
+    if not h5["game"].attrs.get("checkpoint", False):
+        h5.close()
+
+        return None
+
+    for name, value in run.items():
+        saved = h5["game"].attrs.get("checkpoint_" + name)
+
+        if saved != value:
+            h5.close()
+
+            raise ValueError(
+                "Checkpoint {0} was saved with {1} {2}, not {3}; rerun that command or remove "
+                "checkpoint".format(exp_out, name, saved, value)
+            )
+
+    return ExperienceWriter(h5)
+
 def load_game_experience(exp_in):
     print("[+] Loading saved game experience ...\n")
 
@@ -36,6 +99,59 @@ def load_game_experience(exp_in):
     except FileNotFoundError as error:
         raise error
 
+def load_teacher(args, student_encoder):
+    """
+    Load teacher agent and return target function replacing search targets with its outputs.
+    """
+
+    print("[+] Loading teacher agent ...\n")
+
+    if args.temperature <= 0:
+        raise ValueError("Temperature must be positive")
+
+    if not 0 <= args.mix <= 1:
+        raise ValueError("Mix must be between 0 and 1")
+
+    teacher = load_agent(h5py.File("./outputs/agent/" + args.teacher + ".h5", "r"), xla = args.xla)
+
+    if teacher.encoder.board_size != student_encoder.board_size:
+        raise ValueError("Teacher agent plays on {0}x{0} board, not {1}x{1}".format(
+            teacher.encoder.board_size, student_encoder.board_size
+        ))
+
+    return distillation_targets(
+        teacher.predictor, teacher.encoder.model_layout, args.temperature, args.mix
+    )
+
+def open_game_experience(exp_in, readers = 0):
+    """
+    Open one or more experience files for streaming without loading them into memory. A single
+    prefix naming shard set directory opens that shard set instead. Caller closes returned
+    experience after training.
+    """
+
+    print("[+] Opening saved game experience ...\n")
+
+    if len(exp_in) == 1 and is_shard_set("./outputs/exp/" + exp_in[0]):
+        return ShardedExperience("./outputs/exp/" + exp_in[0], workers = readers)
+
+    if len(exp_in) == 1 and is_record_file("./outputs/exp/" + exp_in[0] + ".h5"):
+        return GameRecordExperience("./outputs/exp/" + exp_in[0] + ".h5", workers = readers)
+
+    return ExperienceStream([h5py.File("./outputs/exp/" + exp + ".h5", "r") for exp in exp_in])
+
+def is_record_file(path):
+    with h5py.File(path, "r") as h5:
+        return "records" in h5
+
+def open_replay_buffer(args):
+    return ReplayBuffer(
+        "./outputs/replay/" + args.replay,
+        max_positions   = args.window,
+        max_generations = args.gens,
+        recency         = args.recency
+    )
+
 def parse_args():
     parser = argparse.ArgumentParser(usage = "python " + sys.argv[0] + " -e exp -s 10")
 
@@ -49,7 +165,7 @@ def parse_args():
 
     parser.add_argument(
         "-c", "--cont", action = "store_true",
-        help = "continue game simulations from experience input"
+        help = "continue game simulations from experience input or, with -m, game records"
     )
 
     parser.add_argument(
@@ -57,7 +173,33 @@ def parse_args():
     )
 
     parser.add_argument(
-        "-e", "--exp", type = str, help = "experience input filename prefix"
+        "-e", "--exp", nargs = "+", type = str,
+        help = "experience input filename prefix(es); training accepts several files"
+    )
+
+    parser.add_argument(
+        "-g", "--gens", type = int, help = "replay buffer size in generations (default = none)"
+    )
+
+    parser.add_argument(
+        "-k", "--checkpoint", default = 10, type = int,
+        help = "save experience every this many games; rerun resumes (default = 10, 0 = off)"
+    )
+
+    parser.add_argument(
+        "-m", "--records", type = str,
+        help = "save self-play games as game records (moves and visit counts) with this name"
+    )
+
+    parser.add_argument(
+        "-n", "--network", default = "medium", type = str,
+        help = "network architecture of new agent: small, medium, large or residual tower "
+               "res<blocks>x<filters>, e.g. res6x64 (default = medium)"
+    )
+
+    parser.add_argument(
+        "-p", "--replay", type = str,
+        help = "replay buffer name; self-play experience is added to it and training samples it"
     )
 
     parser.add_argument(
@@ -70,18 +212,133 @@ def parse_args():
         help = "number of games to simulate (default = 0)"
     )
 
+    parser.add_argument(
+        "-t", "--teacher", type = str,
+        help = "teacher agent filename prefix; agent is trained on teacher outputs (distillation)"
+    )
+
+    parser.add_argument(
+        "-w", "--window", default = 500000, type = int,
+        help = "replay buffer size in positions (default = 500000)"
+    )
+
+    parser.add_argument(
+        "-x", "--shards", type = str,
+        help = "write self-play games to shard set with this name instead of single file"
+    )
+
+    parser.add_argument(
+        "--cache", default = 0, type = int,
+        help = "number of positions kept in symmetry-aware evaluation cache (default = 0, off)"
+    )
+
+    parser.add_argument(
+        "--channels-last", action = "store_true",
+        help = "build new agent with channels-last network layout (faster on CPU)"
+    )
+
+    parser.add_argument(
+        "--dedup", action = "store_true",
+        help = "aggregate repeated positions into weighted rows when saving experience"
+    )
+
+    parser.add_argument(
+        "--mix", default = 0.0, type = float,
+        help = "weight of search targets blended into teacher targets (default = 0)"
+    )
+
+    parser.add_argument(
+        "--parallel", default = 1, type = int,
+        help = "number of games played in lockstep with batched evaluation (default = 1)"
+    )
+
+    parser.add_argument(
+        "--readers", default = 0, type = int,
+        help = "number of processes reading shards or replaying game records (default = 0)"
+    )
+
+    parser.add_argument(
+        "--recency", default = 1.0, type = float,
+        help = "replay sampling weight decay per generation of age (default = 1, uniform)"
+    )
+
+    parser.add_argument(
+        "--symmetries", default = 1, type = int,
+        help = "board orientations averaged per position evaluation, 1-8 (default = 1)"
+    )
+
+    parser.add_argument(
+        "--temperature", default = 1.0, type = float,
+        help = "temperature softening teacher policy (default = 1)"
+    )
+
+    parser.add_argument(
+        "--xla", action = "store_true", help = "compile model inference with XLA"
+    )
+
+    add_runtime_arguments(parser)
+
     return parser.parse_args()
 
-def simulate_game(agent_black, agent_white, board_size, collector_black,
-                  collector_white, display = False):
+def check_record_options(args):
+    """
+    Game records hold moves and visit counts of whole games, so they are not aggregated, buffered
+    or sharded. Continuing (-c) adds games to existing records of same name; otherwise existing
+    records are never overwritten.
+    """
+
+    record_file = "./outputs/exp/" + args.records + ".h5"
+    unsupported = [
+        option for option, value in (
+            ("--dedup", args.dedup), ("-e/--exp", args.cont and args.exp),
+            ("-p/--replay", args.replay), ("-x/--shards", args.shards)
+        ) if value
+    ]
+
+    if unsupported:
+        raise ValueError("Game records (-m) cannot be combined with {0}{1}".format(
+            ", ".join(unsupported), "; -c continues records named by -m" if args.cont else ""
+        ))
+
+    if args.cont and not os.path.exists(record_file):
+        raise ValueError("No game records {0} to continue".format(record_file))
+
+    if not args.cont and os.path.exists(record_file):
+        raise ValueError(
+            "Game records {0} already exist; add games with -c or choose another name".format(
+                record_file
+            )
+        )
+
+def complete_episodes(collectors, winner):
+    """
+    Grant reward to winning agent.
+    """
+
+    for player, collector in collectors.items():
+        collector.complete_episode(1 if player == winner else -1)
+
+def experience_collectors():
+    collectors = {
+        Player.black: ExperienceCollector(),
+        Player.white: ExperienceCollector()
+    }
+
+    for collector in collectors.values():
+        collector.begin_episode()
+
+    return collectors
+
+def play_game(agent_black, agent_white, board_size, display = False):
+    """
+    Play one game between agents and return final game state and result.
+    """
+
     agents = {
         Player.black: agent_black,
         Player.white: agent_white
     }
 
-    collector_black.begin_episode()
-    collector_white.begin_episode()
-
     game      = GameState.new_game(board_size)
     num_moves = 0
 
@@ -93,19 +350,192 @@ def simulate_game(agent_black, agent_white, board_size, collector_black,
     result = score.compute_result(game)
 
     if display:
-        print("\n===== Game Result =====\n")
-        print_board(game.board)
-        print()
-        print("Score:", result, "in", num_moves, "moves")
+        print_result(game, result, num_moves)
+
+    return game, result
+
+def print_result(game, result, num_moves):
+    print("\n===== Game Result =====\n")
+    print_board(game.board)
+    print()
+    print("Score:", result, "in", num_moves, "moves")
+    print()
+
+def record_collectors(encoder):
+    """
+    Both agents report decisions to same recorder, in move order.
+    """
+
+    recorder = GameRecorder(encoder)
+
+    recorder.begin_episode()
+
+    return {
+        Player.black: recorder,
+        Player.white: recorder
+    }
+
+def save_experience(exp_out, game_exp):
+    """
+    Write experience to temporary file and move it over exp_out, so that crash while writing leaves
+    previous file intact.
+    """
+
+    if not os.path.exists("./outputs/exp"):
+        os.makedirs("./outputs/exp")
+
+    with h5py.File(exp_out + ".part", "w") as h5:
+        game_exp.serialize(h5)
+
+    os.replace(exp_out + ".part", exp_out)
+
+def simulate_games(args, agent_black, agent_white, new_collectors, sim_start = 0):
+    """
+    Run game simulations sim_start to args.sims - 1 and yield (index, game, result, collectors)
+    for each finished game, where collectors (from new_collectors()) recorded its decisions.
+
+    With args.parallel above 1, games are played in lockstep and positions of all games are
+    evaluated in batches (see lockstep.py). Black agent then plays both colors, since both agents
+    play same network in self-play, and games may finish out of order.
+    """
+
+    if args.parallel > 1:
+        agents = {
+            Player.black: agent_black,
+            Player.white: agent_black
+        }
+
+        for entry in play_games(agents, args.board, args.sims, args.parallel, new_collectors,
+                                sim_start):
+            print("[-] Game {0} / {1} finished --- {2} round(s) per move".format(
+                entry.index + 1, args.sims, args.rounds
+            ))
+
+            if args.disp:
+                print_result(entry.game, entry.result, entry.num_moves)
+
+            yield entry.index, entry.game, entry.result, entry.collectors
+
+        return
+
+    for i in range(sim_start, args.sims):
+        print("[-] Game {0} / {1} --- {2} round(s) per move".format(i + 1, args.sims, args.rounds))
+
+        collectors = new_collectors()
+
+        agent_black.set_collector(collectors[Player.black])
+        agent_white.set_collector(collectors[Player.white])
+
+        game, result = play_game(agent_black, agent_white, args.board, args.disp)
+
+        yield i, game, result, collectors
+
+def simulate_to_records(args, agent_black, agent_white):
+    """
+    Run game simulations and save them as game records (moves, visit counts and winner) instead
+    of board tensors. With args.cont, games are added to existing records of same name.
+    """
+
+    record_file = "./outputs/exp/" + args.records + ".h5"
+
+    if args.cont:
+        with h5py.File(record_file, "r") as h5:
+            recorder = load_records(h5, agent_black.encoder)
+    else:
+        recorder = GameRecorder(agent_black.encoder)
+
+    sim_start = len(recorder.moves)
+    run_start = datetime.now()  # running start time
+
+    if sim_start >= args.sims:
+        raise ValueError("Game records already hold {0} game(s)!".format(sim_start))
+
+    for _, game, result, collectors in simulate_games(
+        args, agent_black, agent_white, lambda: record_collectors(agent_black.encoder), sim_start
+    ):
+        collectors[Player.black].complete_game(game, result.winner)
+
+        recorder.extend(collectors[Player.black])
+
+    if not args.disp:
         print()
 
-    # Grant reward to winning agent.
-    if result.winner == Player.black:
-        collector_black.complete_episode(1)
-        collector_white.complete_episode(-1)
+    print("[+] Running time: {0}".format(datetime.now() - run_start))
+
+    if not os.path.exists("./outputs/exp"):
+        os.makedirs("./outputs/exp")
+
+    # Continued records are replaced only once new file is complete.
+    with h5py.File(record_file + ".part", "w") as h5:
+        recorder.serialize(h5)
+
+    os.replace(record_file + ".part", record_file)
+
+def simulate_to_shards(args, agent_black, agent_white):
+    """
+    Run game simulations and write each finished game to shard set. Any number of processes can
+    run this concurrently on same shard set; each run numbers its games from own block of indices.
+    """
+
+    shard_dir = "./outputs/exp/" + args.shards
+
+    if args.cont and is_shard_set(shard_dir):
+        sim_start = ShardedExperience(shard_dir).game_count + 1
     else:
-        collector_black.complete_episode(-1)
-        collector_white.complete_episode(1)
+        sim_start = 0
+
+    if sim_start >= args.sims:
+        raise ValueError("Game experience already underwent {0} run(s)!".format(sim_start))
+
+    writer     = ShardWriter(shard_dir, args.board)
+    first_game = writer.claim_games(args.sims - sim_start)
+    run_start  = datetime.now()  # running start time
+
+    for i, _, result, collectors in simulate_games(
+        args, agent_black, agent_white, experience_collectors, sim_start
+    ):
+        complete_episodes(collectors, result.winner)
+
+        writer.write_game(
+            np.concatenate([np.array(cl.states)       for cl in collectors.values()]),
+            np.concatenate([np.array(cl.visit_counts) for cl in collectors.values()]),
+            np.concatenate([np.array(cl.rewards)      for cl in collectors.values()]),
+            first_game + i - sim_start
+        )
+
+    writer.close()
+
+    if not args.disp:
+        print()
+
+    print("[+] Running time: {0}".format(datetime.now() - run_start))
+
+def start_checkpoint(exp_out, run, game_exp = None):
+    """
+    Create experience file at exp_out holding earlier experience (continued file) if any, and
+    return writer appending to it. File is flagged as checkpoint of run (see load_checkpoint())
+    until run completes, so that rerunning same command resumes.
+    """
+
+    if not os.path.exists("./outputs/exp"):
+        os.makedirs("./outputs/exp")
+
+    writer = ExperienceWriter(h5py.File(exp_out, "w"))
+
+    writer.h5file["game"].attrs["checkpoint"] = True
+
+    for name, value in run.items():
+        writer.h5file["game"].attrs["checkpoint_" + name] = value
+
+    if game_exp is not None:
+        writer.write_rows(
+            game_exp.states, game_exp.visit_counts, game_exp.rewards, game_exp.weights,
+            game_exp.game_count + 1, keys = game_exp.keys
+        )
+
+    writer.close()
+
+    return writer
 
 def main():
     print("\n========== Agent Training Module ==========\n")
@@ -113,6 +543,12 @@ def main():
     # Configure command line argument parser.
     args = parse_args()
 
+    # Pin cores and size thread pools before TensorFlow is loaded.
+    configure_runtime_from_args(args)
+
+    if args.sims and args.records:
+        check_record_options(args)
+
     agent      = args.agent
     board_size = args.board
     cont_sims  = args.cont
@@ -123,80 +559,163 @@ def main():
 
     # Load saved agent from disk or initialize new ones.
     if agent:
-        agent_black = load_agent(h5py.File("./outputs/agent/" + agent + ".h5", "r"), rounds)
-        agent_white = load_agent(h5py.File("./outputs/agent/" + agent + ".h5", "r"), rounds)
+        agent_file  = "./outputs/agent/" + agent + ".h5"
+        agent_black = load_agent(h5py.File(agent_file, "r"), rounds, args.xla, args.symmetries)
+        agent_white = load_agent(h5py.File(agent_file, "r"), rounds, args.xla, args.symmetries)
     else:
-        game_encoder = Encoder(board_size)
-        model        = nn.build_model(game_encoder.shape(), game_encoder.num_moves())
+        from networks.config import build_network
+
+        data_format  = "channels_last" if args.channels_last else "channels_first"
+        game_encoder = Encoder(board_size, data_format)
+        model        = build_network(args.network, game_encoder)
 
         # Initialize two new game agents with model and game encoder.
-        agent_black = EunkyoAgent(model, game_encoder, rounds)
-        agent_white = EunkyoAgent(model, game_encoder, rounds)
+        agent_black = EunkyoAgent(
+            model, game_encoder, rounds, xla = args.xla, symmetries = args.symmetries
+        )
+        agent_white = EunkyoAgent(
+            model, game_encoder, rounds, xla = args.xla, symmetries = args.symmetries
+        )
 
-    # Initialize experience collectors.
-    collector_black = ExperienceCollector()
-    collector_white = ExperienceCollector()
+        agent_black.warm_up()
+        agent_white.warm_up()
 
-    # Connect agents to experience collectors.
-    agent_black.set_collector(collector_black)
-    agent_white.set_collector(collector_white)
+    # Both agents play same network, so they share evaluations.
+    if args.cache:
+        cache = EvaluationCache(board_size, agent_black.encoder.num_planes, args.cache)
+
+        agent_black.set_cache(cache)
+        agent_white.set_cache(cache)
 
     # Run game simulations or train Go agent from experience.
-    if sims:
+    if sims and args.records:
+        print("[+] Running game simulations ...\n")
+
+        simulate_to_records(args, agent_black, agent_white)
+    elif sims and args.shards:
         print("[+] Running game simulations ...\n")
 
-        if cont_sims:
-            game_exp  = load_game_experience(exp_in)
+        simulate_to_shards(args, agent_black, agent_white)
+    elif sims:
+        print("[+] Running game simulations ...\n")
+
+        exp_out  = "./outputs/exp/exp"
+        exp_out += "_b" + str(board_size)
+        exp_out += "_g" + str(sims)
+        exp_out += "_r" + str(rounds)
+        exp_out += ".h5"
+
+        # Interrupted run of same command resumes from its last checkpoint.
+        run = {
+            "agent" : agent or "new " + args.network + " network",
+            "input" : exp_in[0] if cont_sims else "none"
+        }
+
+        writer   = load_checkpoint(exp_out, run)
+        game_exp = None
+
+        if writer is not None:
+            sim_start = writer.num_games
+            keyless   = not writer.has_keys
+
+            print("[+] Resuming from checkpoint after {0} game(s)\n".format(sim_start))
+        elif cont_sims:
+            game_exp  = load_game_experience(exp_in[0])
             sim_start = game_exp.game_count + 1
+            keyless   = game_exp.keys is None
         else:
             sim_start = 0
+            keyless   = False
 
         if sim_start >= sims:
             raise ValueError("Game experience already underwent {0} run(s)!".format(sim_start))
 
-        run_start = datetime.now()  # running start time
+        # Check before games are played, since aggregation runs only after last game.
+        if args.dedup and keyless:
+            raise ValueError(
+                "Game experience has no position keys to aggregate by; continue without --dedup"
+            )
 
-        for i in range(sim_start, sims):
-            print("[-] Game {0} / {1} --- {2} round(s) per move".format(i + 1, sims, rounds))
+        if writer is None:
+            writer = start_checkpoint(exp_out, run, game_exp)
 
-            simulate_game(agent_black, agent_white, board_size, collector_black,
-                          collector_white, display)
+        collectors = []
+        run_start  = datetime.now()  # running start time
+
+        # Games finished since last checkpoint are appended to experience file.
+        for num_games, (_, _, result, game_collectors) in enumerate(simulate_games(
+            args, agent_black, agent_white, experience_collectors, sim_start
+        ), sim_start + 1):
+            complete_episodes(game_collectors, result.winner)
+
+            collectors += game_collectors.values()
+
+            if args.checkpoint and num_games % args.checkpoint == 0 and num_games < sims:
+                append_experience(writer, collectors, num_games)
+
+                collectors = []
 
         if not display:
             print()
 
         print("[+] Running time: {0}".format(datetime.now() - run_start))
 
-        if cont_sims:
-            collector_black.states       += game_exp.states.tolist()
-            collector_black.visit_counts += game_exp.visit_counts.tolist()
-            collector_black.rewards      += game_exp.rewards.tolist()
+        # Record simulation experience; completed run is no longer checkpoint.
+        append_experience(writer, collectors, sims)
 
-        # Record simulation experience.
-        game_exp = combine_experience(i, [collector_black, collector_white])
+        for name in list(writer.h5file["game"].attrs):
+            if name.startswith("checkpoint"):
+                del writer.h5file["game"].attrs[name]
 
-        exp_out  = "./outputs/exp/exp"
-        exp_out += "_b" + str(board_size)
-        exp_out += "_g" + str(sims)
-        exp_out += "_r" + str(rounds)
-        exp_out += ".h5"
+        # Merge repeated positions into weighted rows.
+        if args.dedup:
+            game_exp = load_experience(writer.h5file)
+            num_rows = game_exp.num_examples
+            game_exp = aggregate_positions(game_exp)
+
+            writer.h5file.close()
 
-        # Save experience to disk.
-        if not os.path.exists("./outputs/exp"):
-            os.makedirs("./outputs/exp")
+            save_experience(exp_out, game_exp)
 
-        with h5py.File(exp_out, "w") as h5:
-            game_exp.serialize(h5)
+            print("[+] Aggregated {0} position(s) into {1}".format(num_rows, game_exp.num_examples))
+        else:
+            writer.h5file.close()
+
+        # Register new generation with replay buffer, which drops experience outside window.
+        if args.replay:
+            replay_buffer = open_replay_buffer(args)
+
+            replay_buffer.add(exp_out)
+            replay_buffer.close()
+
+            print("[+] Replay buffer: {0} position(s) in {1} generation(s)".format(
+                replay_buffer.num_examples, len(replay_buffer.generations)
+            ))
     else:
         print("[+] Training agent ...\n")
 
-        game_exp = load_game_experience(exp_in)
+        if args.replay:
+            game_exp = open_replay_buffer(args)
+        else:
+            game_exp = open_game_experience(exp_in, args.readers)
 
         train_start = datetime.now()  # training start time
 
-        agent_black.train(game_exp)
+        try:
+            if args.teacher:
+                agent_black.train(game_exp, targets = load_teacher(args, agent_black.encoder),
+                                  prefix = "eunkyo_distilled")
+            else:
+                agent_black.train(game_exp)
+        finally:
+            game_exp.close()
 
         print("\n[+] Training time: {0}".format(datetime.now() - train_start))
 
+    if args.cache and sims:
+        print("[+] Evaluation cache: {0:.1%} hit rate, {1} position(s)".format(
+            agent_black.cache.hit_rate(), len(agent_black.cache)
+        ))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,70 @@
+"""
+
+This helper module implements match statistics for agent evaluation: Elo difference estimated from
+wins and losses with its confidence interval, and sequential probability ratio test (SPRT) deciding
+between two Elo hypotheses as games come in. Go games have no draws, so each game is a Bernoulli
+trial with winning probability given by Elo difference.
+
+"""
+
+from statistics import NormalDist
+
+import math
+
+
+def elo_estimate(wins, losses, confidence = 0.95):
+    """
+    Return (elo, lower, upper): Elo difference of winning rate and bounds of its Wilson score
+    interval. After only wins (or only losses), Elo and upper (or lower) bound are infinite.
+    """
+
+    num_games = wins + losses
+
+    if num_games == 0:
+        return 0.0, -math.inf, math.inf
+
+    z     = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate  = wins / num_games
+    scale = 1 + z * z / num_games
+
+    center = (rate + z * z / (2 * num_games)) / scale
+    half   = z * math.sqrt(rate * (1 - rate) / num_games + z * z / (4 * num_games * num_games))
+    lower  = score_to_elo(center - half / scale) if wins   else -math.inf
+    upper  = score_to_elo(center + half / scale) if losses else math.inf
+
+    return score_to_elo(rate), lower, upper
+
+def elo_to_score(elo):
+    """
+    Expected score (winning probability) of player elo points stronger than opponent.
+    """
+
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def score_to_elo(score):
+    if score <= 0:
+        return -math.inf
+
+    if score >= 1:
+        return math.inf
+
+    return -400 * math.log10(1 / score - 1)
+
+def sprt_bounds(alpha, beta):
+    """
+    Return (lower, upper) log-likelihood ratio bounds of SPRT with false positive rate alpha and
+    false negative rate beta.
+    """
+
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def sprt_llr(wins, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of match result under H1 (Elo difference is elo1) against H0 (Elo
+    difference is elo0).
+    """
+
+    score0 = elo_to_score(elo0)
+    score1 = elo_to_score(elo1)
+
+    return wins * math.log(score1 / score0) + losses * math.log((1 - score1) / (1 - score0))
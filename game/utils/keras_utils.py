@@ -4,60 +4,95 @@ This helper module implements functions to load and save deep learning models.
 
 """
 
-from keras.models import load_model
-from keras.models import save_model
+from collections  import OrderedDict
+from keras.models import model_from_json
+
+import numpy as np
 
-import h5py
 import keras
-import tempfile
 import os
 
 
-def load_model_from_hdf5_group(input_file, objects = None):
+MODEL_CACHE_SIZE = 8  # shared models kept, least recently used evicted first
+
+model_cache = OrderedDict()
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode("utf8")
+
+    return value
+
+def load_model_from_hdf5_group(input_file, objects = None, shared = False):
     """
-    Load model from HDF5 file and read using Keras.
+    Build model from architecture stored in HDF5 group and read its weights straight from open
+    group, without copying model to temporary file.
+
+    With shared set, model loaded from same file and group is built once and shared by all callers
+    that set shared, so it must not be trained or otherwise modified. Only MODEL_CACHE_SIZE shared
+    models are kept.
     """
 
-    temp_fd, temp_fname = tempfile.mkstemp(prefix = "tmp_model_")
+    file_name = os.path.abspath(input_file.file.filename)
+    cache_key = (file_name, input_file.name, os.path.getmtime(file_name))
+
+    if shared and cache_key in model_cache:
+        model_cache.move_to_end(cache_key)
+
+        return model_cache[cache_key]
 
-    try:
-        os.close(temp_fd)
+    root_item = input_file["keras_model"]
+    model     = model_from_json(_decode(root_item.attrs["model_config"]), custom_objects = objects)
 
-        root_item        = input_file.get("keras_model")
-        serialized_model = h5py.File(temp_fname, "w")
+    # Keras HDF5 layout keeps weights in "model_weights" group when full model was saved.
+    if "model_weights" in root_item:
+        weights_group = root_item["model_weights"]
+    else:
+        weights_group = root_item
 
-        for attr_name, attr_value in root_item.attrs.items():
-            serialized_model.attrs[attr_name] = attr_value
+    for layer_name in weights_group.attrs["layer_names"]:
+        layer_group  = weights_group[_decode(layer_name)]
+        weight_names = [_decode(name) for name in layer_group.attrs["weight_names"]]
 
-        for key in root_item.keys():
-            input_file.copy(root_item.get(key), serialized_model, key)
+        if weight_names:
+            model.get_layer(_decode(layer_name)).set_weights(
+                [np.asarray(layer_group[name]) for name in weight_names]
+            )
 
-        serialized_model.close()
+    if shared:
+        model_cache[cache_key] = model
 
-        return load_model(temp_fname, custom_objects = objects)
-    finally:
-        os.unlink(temp_fname)
+        if len(model_cache) > MODEL_CACHE_SIZE:
+            model_cache.popitem(last = False)
+
+    return model
 
 def save_model_to_hdf5_group(model, output_file):
     """
-    Save full model (including optimizer state) to HDF5 file using Keras.
+    Save model architecture and weights to HDF5 group in Keras HDF5 layout, writing directly into
+    open file. Optimizer state is not saved since agents compile new optimizer for training.
     """
 
-    temp_fd, temp_fname = tempfile.mkstemp(prefix = "tmp_model_")
+    root_item = output_file.create_group("keras_model")
+
+    root_item.attrs["backend"]       = keras.backend.backend()
+    root_item.attrs["keras_version"] = keras.__version__
+    root_item.attrs["model_config"]  = model.to_json()
 
-    try:
-        os.close(temp_fd)
+    weights_group = root_item.create_group("model_weights")
 
-        save_model(model, temp_fname, save_format = "h5")
+    weights_group.attrs["backend"]       = keras.backend.backend()
+    weights_group.attrs["keras_version"] = keras.__version__
+    weights_group.attrs["layer_names"]   = [layer.name.encode("utf8") for layer in model.layers]
 
-        serialized_model = h5py.File(temp_fname, "r")
-        root_item        = serialized_model.get("/")
+    for layer in model.layers:
+        layer_group  = weights_group.create_group(layer.name)
+        weight_names = [weight.name for weight in layer.weights]
 
-        serialized_model.copy(root_item, output_file, "keras_model")
+        layer_group.attrs["weight_names"] = [name.encode("utf8") for name in weight_names]
 
-        serialized_model.close()
-    finally:
-        os.unlink(temp_fname)
+        for name, value in zip(weight_names, layer.get_weights()):
+            layer_group.create_dataset(name, data = value)
 
 def set_gpu_memory_target(fraction):
     """
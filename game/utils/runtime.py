@@ -0,0 +1,139 @@
+"""
+
+This helper module configures per-process inference runtime: CPU cores the process may run on and
+number of threads used by TensorFlow, TensorFlow Lite and BLAS. Several self-play processes on one
+host should each get own cores and matching thread count instead of oversubscribing all cores.
+
+Configuration must happen before TensorFlow is imported, since thread pools are created with
+runtime and cannot be resized afterwards.
+
+"""
+
+import os
+import sys
+
+
+runtime_config = {
+    "cpus"          : None,  # None = all cores
+    "inter_threads" : 0,     # 0 = library default
+    "threads"       : 0
+}
+
+def add_runtime_arguments(parser):
+    parser.add_argument(
+        "--cpus", type = str, help = "pin process to CPU cores, e.g. 0-3,8 (default = all)"
+    )
+
+    parser.add_argument(
+        "--inter-threads", default = 0, type = int,
+        help = "threads running independent operations in parallel (default = 0, automatic)"
+    )
+
+    parser.add_argument(
+        "--threads", default = 0, type = int,
+        help = "threads used within each inference operation (default = 0, automatic)"
+    )
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+def configure_runtime(cpus = None, threads = 0, inter_threads = 0):
+    """
+    Pin process to cpus (list of core indices) and limit thread counts. Unless set explicitly,
+    thread count follows number of pinned cores.
+    """
+
+    if cpus:
+        if not hasattr(os, "sched_setaffinity"):
+            raise ValueError("CPU pinning is not supported on this platform")
+
+        os.sched_setaffinity(0, cpus)
+
+        if not threads:
+            threads = len(cpus)
+
+    runtime_config["cpus"]          = cpus
+    runtime_config["inter_threads"] = inter_threads
+    runtime_config["threads"]       = threads
+
+    if threads:
+        os.environ["OMP_NUM_THREADS"]        = str(threads)
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+
+        # BLAS pools used by NumPy engine already exist, so limit them at runtime if possible.
+        try:
+            from threadpoolctl import threadpool_limits
+
+            threadpool_limits(threads)
+        except ImportError:
+            pass
+
+    if inter_threads:
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_threads)
+
+    if "tensorflow" in sys.modules:
+        import tensorflow as tf
+
+        try:
+            if threads:
+                tf.config.threading.set_intra_op_parallelism_threads(threads)
+
+            if inter_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+        except RuntimeError:
+            raise RuntimeError("Runtime must be configured before TensorFlow is initialized")
+
+def configure_runtime_from_args(args):
+    configure_runtime(parse_cpus(args.cpus), args.threads, args.inter_threads)
+
+def configure_worker_runtime(args, worker, num_workers):
+    """
+    Configure runtime of one of num_workers processes sharing host: worker is pinned to its share
+    of --cpus, if given, and its thread pools are sized to its share of cores unless --threads is
+    given, so that workers together do not oversubscribe cores.
+    """
+
+    cpus = parse_cpus(args.cpus)
+
+    if cpus:
+        cpus    = split_cpus(cpus, num_workers)[worker]
+        threads = args.threads or len(cpus)
+    else:
+        threads = args.threads or max(1, available_cores() // num_workers)
+
+    configure_runtime(cpus, threads, args.inter_threads)
+
+def parse_cpus(cpus):
+    """
+    Parse core list such as "0-3,8" into list of core indices.
+    """
+
+    if not cpus:
+        return None
+
+    cores = []
+
+    for part in cpus.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cores      += range(int(first), int(last) + 1)
+        else:
+            cores.append(int(part))
+
+    return sorted(set(cores))
+
+def split_cpus(cpus, num_parts):
+    """
+    Split core list into num_parts contiguous groups of near-equal size. With fewer cores than
+    parts, parts share cores one each.
+    """
+
+    if len(cpus) < num_parts:
+        return [[cpus[i % len(cpus)]] for i in range(num_parts)]
+
+    bounds = [len(cpus) * i // num_parts for i in range(num_parts + 1)]
+
+    return [cpus[bounds[i]:bounds[i + 1]] for i in range(num_parts)]
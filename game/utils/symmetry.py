@@ -0,0 +1,92 @@
+"""
+
+This helper module implements the eight dihedral symmetries of the Go board (four rotations, each
+optionally mirrored) for encoded board tensors and policy vectors.
+
+"""
+
+import numpy as np
+
+
+NUM_SYMMETRIES = 8
+
+permutation_tables = {}
+
+def transform_planes(planes, symmetry):
+    """
+    Apply symmetry to last two (spatial) axes of array. Symmetries 0-3 rotate board by 0, 90, 180
+    or 270 degrees; symmetries 4-7 mirror board before rotating.
+    """
+
+    if symmetry >= 4:
+        planes = np.flip(planes, axis = -1)
+
+    return np.rot90(planes, symmetry % 4, axes = (-2, -1))
+
+def move_permutations(board_size):
+    """
+    Return (8, num_moves) gather table such that policy[..., table[s]] is policy vector of board
+    transformed by symmetry s. Last index (pass) maps to itself under every symmetry.
+    """
+
+    if board_size not in permutation_tables:
+        num_points = board_size * board_size
+        grid       = np.arange(num_points).reshape((board_size, board_size))
+        table      = np.empty((NUM_SYMMETRIES, num_points + 1), dtype = np.int64)
+
+        for symmetry in range(NUM_SYMMETRIES):
+            table[symmetry, :num_points] = transform_planes(grid, symmetry).reshape(num_points)
+            table[symmetry, num_points]  = num_points
+
+        permutation_tables[board_size] = table
+
+    return permutation_tables[board_size]
+
+def restore_policies(policies, symmetries, board_size):
+    """
+    Undo symmetries[i] on policies[i], i.e. map policy vectors of transformed boards back onto
+    original board. Inverse of policy part of transform_batch().
+    """
+
+    table    = move_permutations(board_size)[symmetries]
+    restored = np.empty_like(policies)
+
+    np.put_along_axis(restored, table, policies, axis = 1)
+
+    return restored
+
+def transform_batch(states, policies, symmetries):
+    """
+    Apply symmetries[i] to states[i] (num_planes x N x N) and policies[i] (N * N + 1) for every
+    example in batch with single gather per array.
+    """
+
+    table = move_permutations(states.shape[-1])[symmetries]
+
+    return transform_states(states, symmetries), np.take_along_axis(policies, table, axis = 1)
+
+def transform_states(states, symmetries):
+    """
+    Apply symmetries[i] to states[i] (num_planes x N x N) for every example in batch with single
+    gather. State part of transform_batch().
+    """
+
+    num_examples, num_planes, board_size, _ = states.shape
+
+    num_points = board_size * board_size
+    table      = move_permutations(board_size)[symmetries, :num_points]
+
+    flat_states = states.reshape((num_examples, num_planes, num_points))
+    flat_states = np.take_along_axis(flat_states, table[:, np.newaxis, :], axis = 2)
+
+    return flat_states.reshape(states.shape)
+
+def random_symmetries(num_examples, rng = None):
+    """
+    Draw one symmetry uniformly at random for each example.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    return rng.integers(NUM_SYMMETRIES, size = num_examples)
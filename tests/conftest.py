@@ -0,0 +1,14 @@
+"""
+
+Test configuration: game modules import each other by flat module names, as scripts run from game
+directory, so that directory is put on module search path.
+
+"""
+
+import os
+import sys
+
+
+GAME_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "game")
+
+sys.path.insert(0, GAME_DIR)
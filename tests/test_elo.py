@@ -0,0 +1,65 @@
+"""
+
+Tests of Elo estimate and sequential probability ratio test against values worked out by hand.
+
+"""
+
+from utils.elo import elo_estimate
+from utils.elo import elo_to_score
+from utils.elo import score_to_elo
+from utils.elo import sprt_bounds
+from utils.elo import sprt_llr
+
+import math
+import pytest
+
+
+def test_score_and_elo_are_inverse():
+    assert elo_to_score(0) == 0.5
+    assert elo_to_score(400) == pytest.approx(10 / 11)
+
+    for elo in (-800.0, -35.0, 0.0, 35.0, 800.0):
+        assert score_to_elo(elo_to_score(elo)) == pytest.approx(elo)
+
+    assert score_to_elo(0) == -math.inf
+    assert score_to_elo(1) == math.inf
+
+def test_sprt_bounds():
+    lower, upper = sprt_bounds(0.05, 0.05)
+
+    assert lower == pytest.approx(-math.log(19))
+    assert upper == pytest.approx(math.log(19))
+    assert upper == pytest.approx(2.944, abs = 1e-3)
+
+    lower, upper = sprt_bounds(0.05, 0.10)
+
+    assert lower == pytest.approx(math.log(0.10 / 0.95))
+    assert upper == pytest.approx(math.log(0.90 / 0.05))
+
+def test_sprt_llr():
+    assert sprt_llr(60, 40, 0, 35) == pytest.approx(1.508, abs = 1e-3)
+    assert sprt_llr(0, 0, 0, 35) == 0
+    assert sprt_llr(10, 0, 0, 35) > 0
+    assert sprt_llr(0, 10, 0, 35) < 0
+
+    # Swapping hypotheses negates ratio.
+    assert sprt_llr(7, 3, 35, 0) == pytest.approx(-sprt_llr(7, 3, 0, 35))
+
+def test_elo_estimate():
+    elo, lower, upper = elo_estimate(50, 50)
+
+    assert elo == 0
+    assert lower == pytest.approx(-upper)
+    assert lower < 0 < upper
+
+    assert elo_estimate(0, 0) == (0.0, -math.inf, math.inf)
+
+    elo, lower, upper = elo_estimate(0, 10)
+
+    assert elo == lower == -math.inf
+    assert upper < 0
+
+    elo, lower, upper = elo_estimate(10, 0)
+
+    assert elo == upper == math.inf
+    assert lower > 0
@@ -0,0 +1,86 @@
+"""
+
+Tests of evaluation cache lookups across board symmetries.
+
+"""
+
+from evaluation_cache import EvaluationCache
+from utils.symmetry   import NUM_SYMMETRIES
+from utils.symmetry   import transform_batch
+
+import numpy as np
+import pytest
+
+
+NUM_PLANES = 4
+
+def not_evaluated(planes):
+    raise AssertionError("Cached position was evaluated again")
+
+def random_position(board_size, rng):
+    planes = (rng.random((NUM_PLANES, board_size, board_size)) < 0.2).astype(np.float32)
+    priors = rng.random(board_size * board_size + 1)
+
+    return planes, priors / np.sum(priors)
+
+@pytest.mark.parametrize("board_size", (5, 9, 19))
+def test_priors_round_trip_under_all_symmetries(board_size):
+    rng            = np.random.default_rng(board_size)
+    planes, priors = random_position(board_size, rng)
+    cache          = EvaluationCache(board_size, NUM_PLANES)
+
+    cache.evaluate(planes, lambda _: (priors, 0.25))
+
+    states, expected = transform_batch(
+        np.repeat(planes[np.newaxis], NUM_SYMMETRIES, axis = 0),
+        np.repeat(priors[np.newaxis], NUM_SYMMETRIES, axis = 0),
+        np.arange(NUM_SYMMETRIES)
+    )
+
+    for state, expected_priors in zip(states, expected):
+        cached_priors, value = cache.evaluate(state, not_evaluated)
+
+        assert np.allclose(cached_priors, expected_priors)
+        assert value == 0.25
+
+    assert len(cache) == 1
+    assert cache.hits == NUM_SYMMETRIES
+
+def test_cached_priors_are_not_shared():
+    rng            = np.random.default_rng(0)
+    planes, priors = random_position(9, rng)
+    cache          = EvaluationCache(9, NUM_PLANES)
+
+    cache.evaluate(planes, lambda _: (priors.copy(), 0.0))
+    cache.evaluate(planes, not_evaluated)[0][:] = 0
+
+    assert np.allclose(cache.evaluate(planes, not_evaluated)[0], priors)
+
+def test_asymmetric_cache_matches_exact_positions_only():
+    rng            = np.random.default_rng(0)
+    planes, priors = random_position(9, rng)
+    cache          = EvaluationCache(9, NUM_PLANES, symmetric = False)
+
+    cache.evaluate(planes, lambda _: (priors, -0.5))
+
+    assert np.array_equal(cache.evaluate(planes, not_evaluated)[0], priors)
+
+    cache.evaluate(np.flip(planes, axis = -1).copy(), lambda _: (priors, -0.5))
+
+    assert cache.misses == 2
+
+def test_least_recently_used_entry_is_evicted():
+    rng       = np.random.default_rng(1)
+    positions = [random_position(9, rng) for _ in range(3)]
+    cache     = EvaluationCache(9, NUM_PLANES, capacity = 2)
+
+    for planes, priors in positions[:2] + positions[:1] + positions[2:]:
+        cache.evaluate(planes, lambda _: (priors, 0.0))
+
+    assert cache.misses == 3
+
+    cache.evaluate(positions[0][0], not_evaluated)
+    cache.evaluate(positions[2][0], not_evaluated)
+    cache.evaluate(positions[1][0], lambda _: (positions[1][1], 0.0))
+
+    assert cache.misses == 4
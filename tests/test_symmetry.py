@@ -0,0 +1,77 @@
+"""
+
+Tests of board symmetry gather tables against plain NumPy rotations and flips.
+
+"""
+
+from utils.symmetry import NUM_SYMMETRIES
+from utils.symmetry import move_permutations
+from utils.symmetry import restore_policies
+from utils.symmetry import transform_batch
+from utils.symmetry import transform_planes
+from utils.symmetry import transform_states
+
+import numpy as np
+import pytest
+
+
+BOARD_SIZES = (5, 9, 19)
+
+@pytest.mark.parametrize("board_size", BOARD_SIZES)
+def test_move_permutations_are_permutations_keeping_pass(board_size):
+    table = move_permutations(board_size)
+
+    assert table.shape == (NUM_SYMMETRIES, board_size * board_size + 1)
+    assert np.array_equal(table[0], np.arange(board_size * board_size + 1))
+
+    for row in table:
+        assert np.array_equal(np.sort(row), np.arange(board_size * board_size + 1))
+        assert row[-1] == board_size * board_size
+
+@pytest.mark.parametrize("board_size", BOARD_SIZES)
+def test_transform_batch_matches_transform_planes(board_size):
+    rng        = np.random.default_rng(0)
+    states     = rng.random((2 * NUM_SYMMETRIES, 3, board_size, board_size))
+    policies   = rng.random((2 * NUM_SYMMETRIES, board_size * board_size + 1))
+    symmetries = np.tile(np.arange(NUM_SYMMETRIES), 2)
+
+    expected = np.stack([
+        transform_planes(state, symmetry) for state, symmetry in zip(states, symmetries)
+    ])
+
+    assert np.array_equal(transform_batch(states, policies, symmetries)[0], expected)
+
+@pytest.mark.parametrize("board_size", BOARD_SIZES)
+def test_transform_batch_moves_policy_with_board(board_size):
+    rng        = np.random.default_rng(1)
+    policies   = rng.random((NUM_SYMMETRIES, board_size * board_size + 1))
+    states     = policies[:, np.newaxis, :-1].reshape((NUM_SYMMETRIES, 1, board_size, board_size))
+    symmetries = np.arange(NUM_SYMMETRIES)
+
+    new_states, new_policies = transform_batch(states, policies, symmetries)
+
+    # Probability of playing on point stays with that point, and pass is unchanged.
+    assert np.array_equal(new_states.reshape((NUM_SYMMETRIES, -1)), new_policies[:, :-1])
+    assert np.array_equal(new_policies[:, -1], policies[:, -1])
+
+@pytest.mark.parametrize("board_size", BOARD_SIZES)
+def test_restore_policies_inverts_transform_batch(board_size):
+    rng        = np.random.default_rng(2)
+    states     = rng.random((NUM_SYMMETRIES, 2, board_size, board_size))
+    policies   = rng.random((NUM_SYMMETRIES, board_size * board_size + 1))
+    symmetries = np.arange(NUM_SYMMETRIES)
+
+    _, new_policies = transform_batch(states, policies, symmetries)
+
+    assert np.array_equal(restore_policies(new_policies, symmetries, board_size), policies)
+
+@pytest.mark.parametrize("board_size", BOARD_SIZES)
+def test_transform_states_matches_transform_batch(board_size):
+    rng        = np.random.default_rng(3)
+    states     = rng.random((2 * NUM_SYMMETRIES, 3, board_size, board_size))
+    policies   = rng.random((2 * NUM_SYMMETRIES, board_size * board_size + 1))
+    symmetries = np.tile(np.arange(NUM_SYMMETRIES), 2)
+
+    expected, _ = transform_batch(states, policies, symmetries)
+
+    assert np.array_equal(transform_states(states, symmetries), expected)